@@ -4,6 +4,7 @@ from django.forms.models import ModelForm
 from django.contrib.admin.filterspecs import FilterSpec, ChoicesFilterSpec
 from django.contrib.contenttypes.models import ContentType
 from django.core import urlresolvers
+from django.core.serializers.base import DeserializationError
 from django.http import HttpResponseRedirect
 from django.utils.translation import ugettext, ugettext_lazy as _
 import django
@@ -14,11 +15,12 @@ from moderation.models import ModeratedObject, MODERATION_DRAFT_STATE,\
 
 from moderation.forms import BaseModeratedObjectForm
 from moderation.helpers import automoderate
-from moderation.diff import get_changes_between_models
+from moderation.cache import changes_cache
+from moderation.diff import get_changes_between_models, render_changes
 
 
 def approve_objects(modeladmin, request, queryset):
-    for obj in queryset:
+    for obj in queryset.defer(None):
         moderation_message = obj.approve(moderated_by=request.user)
         messages.add_message(request, messages.INFO, moderation_message)
 
@@ -26,7 +28,7 @@ approve_objects.short_description = _("Approve selected moderated objects")
 
 
 def reject_objects(modeladmin, request, queryset):
-    for obj in queryset:
+    for obj in queryset.defer(None):
         moderation_message = obj.reject(moderated_by=request.user)
         messages.add_message(request, messages.INFO, moderation_message)
 
@@ -34,7 +36,7 @@ reject_objects.short_description = _("Reject selected moderated objects")
 
 
 def set_objects_as_pending(modeladmin, request, queryset):
-    for obj in queryset:
+    for obj in queryset.defer(None):
         obj.set_as_pending(moderated_by=request.user)
 #    queryset.update(moderation_status=MODERATION_STATUS_PENDING)
 
@@ -154,13 +156,23 @@ class ModeratedObjectAdmin(admin.ModelAdmin):
         return actions
 
     def content_object(self, obj):
-        return unicode(obj.changed_object)
+        if obj.changed_object_summary:
+            return obj.changed_object_summary
+
+        try:
+            return unicode(obj.changed_object)
+        except DeserializationError, e:
+            # Other objects are listed even if one of them can not be loaded
+            return ugettext(u"Changed object can not be loaded: %s") % e
 
     def queryset(self, request):
         qs = super(ModeratedObjectAdmin, self).queryset(request)
         qs = qs.exclude(moderation_status=MODERATION_STATUS_APPROVED)
 
-        return qs.exclude(moderation_state=MODERATION_DRAFT_STATE)
+        # List shows changed_object_summary, changed_object is loaded
+        # only for objects that have no summary
+        return qs.exclude(moderation_state=MODERATION_DRAFT_STATE)\
+            .defer('changed_object')
 
     def get_moderated_object_form(self, model_class):
 
@@ -176,7 +188,13 @@ class ModeratedObjectAdmin(admin.ModelAdmin):
 
         moderated_object = ModeratedObject.objects.get(pk=object_id)
 
-        changed_obj = moderated_object.changed_object
+        try:
+            changed_obj = moderated_object.changed_object
+        except DeserializationError, e:
+            messages.add_message(
+                request, messages.ERROR,
+                ugettext(u"Changed object can not be loaded: %s") % e)
+            return HttpResponseRedirect('../')
 
         moderator = moderation.get_moderator(changed_obj.__class__)
 
@@ -187,10 +205,6 @@ class ModeratedObjectAdmin(admin.ModelAdmin):
             old_object = moderated_object.get_object_for_this_type()
             new_object = changed_obj
 
-        changes = get_changes_between_models(
-            old_object,
-            new_object,
-            moderator.fields_exclude).values()
         if request.POST:
             admin_form = self.get_form(request, moderated_object)(request.POST)
 
@@ -204,6 +218,16 @@ class ModeratedObjectAdmin(admin.ModelAdmin):
                     moderation_message = moderated_object.reject(request.user, reason)
                     messages.add_message(request, messages.INFO, moderation_message)
 
+        changes = changes_cache.get(moderated_object, old_object, new_object,
+                                    moderator.fields_exclude)
+        if changes is None:
+            changes = render_changes(get_changes_between_models(
+                old_object,
+                new_object,
+                moderator.fields_exclude).values())
+            changes_cache.set(moderated_object, old_object, new_object,
+                              moderator.fields_exclude, changes)
+
         content_type = ContentType.objects.get_for_model(changed_obj.__class__)
         try:
             object_admin_url = urlresolvers.reverse("admin:%s_%s_change" %
@@ -0,0 +1,286 @@
+import copy
+import random
+import threading
+import time
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import FileField
+from django.db.models.fields.files import FieldFile
+from django.utils import translation
+from django.utils.encoding import smart_str
+from django.utils.hashcompat import sha_constructor
+
+
+class ExcludedObjectsCache(object):
+    """Stores pks of objects excluded by moderation manager in Django cache.
+
+       Every content type has version key, cached pks are stored under key
+       containing current version, so bumping version invalidates them
+       in all processes that share cache backend.
+    """
+    key_prefix = 'moderation'
+
+    def _get_content_type_id(self, model_class):
+        return ContentType.objects.get_for_model(model_class).pk
+
+    def _get_version_key(self, model_class):
+        return '%s.version.%s' % (self.key_prefix,
+                                  self._get_content_type_id(model_class))
+
+    def _get_new_version(self):
+        # Versions are based on time, so pks cached before version key
+        # was evicted from cache will not be used again
+        return int(time.time() * 1000) * 1000 + random.randint(0, 999)
+
+    def get_version(self, model_class):
+        from moderation.conf import settings
+
+        key = self._get_version_key(model_class)
+        version = cache.get(key)
+
+        if version is None:
+            cache.add(key, self._get_new_version(), settings.CACHE_TIMEOUT)
+            version = cache.get(key)
+
+        return version
+
+    def bump_version(self, model_class):
+        from moderation.conf import settings
+
+        key = self._get_version_key(model_class)
+
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, self._get_new_version(), settings.CACHE_TIMEOUT)
+
+    def _get_key(self, model_class):
+        return '%s.excluded.%s.%s' % (self.key_prefix,
+                                      self._get_content_type_id(model_class),
+                                      self.get_version(model_class))
+
+    def get(self, model_class):
+        """Returns list of excluded pks or None if it is not cached"""
+        return cache.get(self._get_key(model_class))
+
+    def set(self, model_class, pks):
+        from moderation.conf import settings
+
+        cache.set(self._get_key(model_class), list(pks),
+                  settings.CACHE_TIMEOUT)
+
+
+excluded_objects_cache = ExcludedObjectsCache()
+
+
+class ExcludedObjectsMemo(threading.local):
+    """Keeps pks of objects excluded by moderation manager for every
+       content type during single unit of work, like request or management
+       command. Pks are kept for all objects of model, or for objects
+       of filtered query set under key of its filter.
+       Memo is used only between start() and end() calls.
+    """
+
+    def __init__(self):
+        self.excluded = None
+
+    @property
+    def active(self):
+        return self.excluded is not None
+
+    def start(self):
+        self.excluded = {}
+
+    def end(self):
+        self.excluded = None
+
+    def get(self, model_class, key=None):
+        """Returns list of excluded pks or None if it is not memoized"""
+        if not self.active:
+            return None
+
+        return self.excluded.get(model_class, {}).get(key)
+
+    def set(self, model_class, pks, key=None):
+        if self.active:
+            self.excluded.setdefault(model_class, {})[key] = list(pks)
+
+    def invalidate(self, model_class):
+        if self.active:
+            self.excluded.pop(model_class, None)
+
+
+excluded_objects_memo = ExcludedObjectsMemo()
+
+
+def memoize_excluded_objects(func):
+    """Decorator that memoizes excluded objects while func is running,
+       used with management commands and other code run outside requests
+    """
+    def wrapper(*args, **kwargs):
+        if excluded_objects_memo.active:
+            return func(*args, **kwargs)
+
+        excluded_objects_memo.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            excluded_objects_memo.end()
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+class DeserializedObjectsCache(object):
+    """Bounded LRU cache of objects deserialized by SerializedObjectField,
+       keyed by digest of serialized value. Cache keeps its own copies
+       of objects and returns new copy on every hit, so returned objects
+       can be changed freely.
+    """
+    PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self.hits = 0
+            self.misses = 0
+            self._links = {}
+            # Circular doubly linked list, most recently used link
+            # is next to root
+            self._root = []
+            self._root[:] = [self._root, self._root, None, None]
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._links)
+
+    def get_key(self, *values):
+        return sha_constructor(
+            '\x00'.join([smart_str(value) for value in values])).hexdigest()
+
+    def _copy(self, obj):
+        obj_copy = copy.copy(obj)
+        if hasattr(obj, '_state'):
+            obj_copy._state = copy.copy(obj._state)
+
+        for field in obj._meta.fields:
+            if isinstance(field, FileField):
+                value = obj_copy.__dict__.get(field.attname)
+                if isinstance(value, FieldFile):
+                    # FieldFile is bound to instance, it is created again
+                    # for copy on access
+                    obj_copy.__dict__[field.attname] = value.name
+
+        return obj_copy
+
+    def _unlink(self, link):
+        link[self.PREV][self.NEXT] = link[self.NEXT]
+        link[self.NEXT][self.PREV] = link[self.PREV]
+
+    def _link_first(self, link):
+        root = self._root
+        link[self.PREV] = root
+        link[self.NEXT] = root[self.NEXT]
+        root[self.NEXT][self.PREV] = link
+        root[self.NEXT] = link
+
+    def get(self, key):
+        """Returns copy of cached object or None if it is not cached"""
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._unlink(link)
+            self._link_first(link)
+            obj = link[self.VALUE]
+        finally:
+            self._lock.release()
+
+        return self._copy(obj)
+
+    def set(self, key, obj):
+        from moderation.conf import settings
+
+        size = settings.DESERIALIZED_CACHE_SIZE
+        if not size:
+            return
+
+        obj = self._copy(obj)
+
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[self.VALUE] = obj
+            else:
+                link = [None, None, key, obj]
+                self._links[key] = link
+            self._link_first(link)
+
+            while len(self._links) > size:
+                last = self._root[self.PREV]
+                self._unlink(last)
+                del self._links[last[self.KEY]]
+        finally:
+            self._lock.release()
+
+
+deserialized_objects_cache = DeserializedObjectsCache()
+
+
+class ChangesCache(object):
+    """Stores rendered changes shown for moderated object in Django cache.
+
+       Key contains fingerprints of both compared objects, changed object
+       and object stored in database, so cached changes are not used
+       after any of them was changed.
+    """
+    key_prefix = 'moderation'
+
+    def _get_key(self, moderated_object, old_object, new_object,
+                 fields_exclude):
+        from moderation.diff import get_fingerprint
+
+        values = [get_fingerprint(old_object), get_fingerprint(new_object),
+                  u','.join(sorted(fields_exclude)),
+                  translation.get_language()]
+        return '%s.changes.%s.%s' % (
+            self.key_prefix, moderated_object.pk,
+            sha_constructor('\x00'.join([smart_str(value)
+                                         for value in values])).hexdigest())
+
+    def get(self, moderated_object, old_object, new_object, fields_exclude):
+        """Returns list of rendered changes or None if it is not cached"""
+        from moderation.conf import settings
+
+        if settings.CHANGES_CACHE_TIMEOUT is None:
+            return None
+
+        return cache.get(self._get_key(moderated_object, old_object,
+                                       new_object, fields_exclude))
+
+    def set(self, moderated_object, old_object, new_object, fields_exclude,
+            changes):
+        from moderation.conf import settings
+
+        if settings.CHANGES_CACHE_TIMEOUT is None:
+            return
+
+        cache.set(self._get_key(moderated_object, old_object, new_object,
+                                fields_exclude),
+                  list(changes), settings.CHANGES_CACHE_TIMEOUT)
+
+
+changes_cache = ChangesCache()
@@ -2,3 +2,37 @@ from django.conf import settings
 
 
 MODERATORS = getattr(settings, "DJANGO_MODERATION_MODERATORS", ())
+
+FILTER_CHUNK_SIZE = getattr(settings, "DJANGO_MODERATION_FILTER_CHUNK_SIZE",
+                            999)
+
+CACHE_TIMEOUT = getattr(settings, "DJANGO_MODERATION_CACHE_TIMEOUT", 300)
+
+CODEC = getattr(settings, "DJANGO_MODERATION_CODEC", None)
+
+COMPRESS_THRESHOLD = getattr(settings,
+                             "DJANGO_MODERATION_COMPRESS_THRESHOLD", None)
+
+STORE_DELTA = getattr(settings, "DJANGO_MODERATION_STORE_DELTA", False)
+
+DESERIALIZED_CACHE_SIZE = getattr(settings,
+                                  "DJANGO_MODERATION_DESERIALIZED_CACHE_SIZE",
+                                  100)
+
+BLOB_THRESHOLD = getattr(settings, "DJANGO_MODERATION_BLOB_THRESHOLD", None)
+
+BLOB_ROOT = getattr(settings, "DJANGO_MODERATION_BLOB_ROOT", None)
+
+BLOB_STORAGE = getattr(settings, "DJANGO_MODERATION_BLOB_STORAGE",
+                       "moderation.storage.FileSystemBlobStorage")
+
+DIFF_TIMEOUT = getattr(settings, "DJANGO_MODERATION_DIFF_TIMEOUT", 1.0)
+
+DIFF_MAX_TOKENS = getattr(settings, "DJANGO_MODERATION_DIFF_MAX_TOKENS", 20000)
+
+CHANGES_CACHE_TIMEOUT = getattr(settings,
+                                "DJANGO_MODERATION_CHANGES_CACHE_TIMEOUT",
+                                3600)
+
+RENDER_DIFF_WITHOUT_TEMPLATE = getattr(
+    settings, "DJANGO_MODERATION_RENDER_DIFF_WITHOUT_TEMPLATE", False)
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 
 import re
-import difflib
+import time
 
 from django.db.models import fields, ForeignKey, FileField
-from django.utils.encoding import force_unicode
-from django.utils.html import escape
+from django.db.models.fields.files import FieldFile
+from django.utils.encoding import force_unicode, iri_to_uri, smart_str
+from django.utils.hashcompat import sha_constructor
+from django.utils.html import conditional_escape, escape
+from django.utils.safestring import mark_safe
 from django.core.urlresolvers import reverse, NoReverseMatch
 
 
@@ -25,32 +28,92 @@ class BaseChange(object):
 
         return render_to_string(template, context)
 
+
+class ForeignKeyResolver(object):
+    """Collects primary keys of related objects of foreign key changes,
+       objects of related model are loaded with single in_bulk query when
+       first of them is needed. Admin change URL of related model is
+       reversed once, with placeholder in place of primary key
+    """
+    placeholder = 'moderation-pk-placeholder'
+
+    def __init__(self):
+        self.pks = {}
+        self.objects = {}
+        self.url_patterns = {}
+
+    def add(self, model, pk):
+        if pk is not None:
+            pk = model._meta.pk.to_python(pk)
+            self.pks.setdefault(model, set()).add(pk)
+
+    def get_object(self, model, pk):
+        if pk is None:
+            return None
+
+        if model in self.pks:
+            pks = list(self.pks.pop(model))
+            self.objects.setdefault(model, {}).update(
+                model._default_manager.in_bulk(pks))
+
+        return self.objects.get(model, {}).get(model._meta.pk.to_python(pk))
+
+    def get_url(self, model, pk):
+        name = 'admin:%s_%s_change' % (model._meta.app_label,
+                                       model._meta.object_name.lower())
+
+        if model not in self.url_patterns:
+            try:
+                self.url_patterns[model] = reverse(name,
+                                                   args=[self.placeholder])
+            except NoReverseMatch:
+                self.url_patterns[model] = None
+
+        if self.url_patterns[model] is not None:
+            return self.url_patterns[model].replace(
+                self.placeholder, iri_to_uri(force_unicode(pk)))
+
+        # URL pattern does not accept placeholder
+        try:
+            return reverse(name, args=[pk])
+        except NoReverseMatch:
+            return None
+
+
 class ForeignKeyChange(BaseChange):
+
+    def __init__(self, verbose_name, field, change, resolver=None):
+        super(ForeignKeyChange, self).__init__(verbose_name, field, change)
+        if resolver is None:
+            resolver = ForeignKeyResolver()
+        self.resolver = resolver
+
+        for pk in change:
+            resolver.add(field.rel.to, pk)
+
+    def _get_value(self, pk):
+        rel_to = self.field.rel.to
+        value = self.resolver.get_object(rel_to, pk)
+        if value is None:
+            # Related object does not exist
+            return conditional_escape(force_unicode(pk))
+
+        value = conditional_escape(force_unicode(value))
+        url = self.resolver.get_url(rel_to, pk)
+        if url:
+            return u'<a href="%(url)s">%(value)s</a>' % {
+                'url': conditional_escape(url), 'value': value}
+        return value
+
     @property
     def diff(self):
-        rel_to = self.field.rel.to
         pk1, pk2 = self.change
-        value1, value2 = rel_to.objects.get(pk=self.change[0]), rel_to.objects.get(pk=self.change[1])
-        
-        try:
-            url1 = reverse( 'admin:%s_%s_change' % (rel_to._meta.app_label, rel_to._meta.object_name.lower()),args=[pk1] ) 
-        except NoReverseMatch:
-            url1 = None
+        if pk1 == pk2:
+            return self._get_value(pk1)
+
+        return u'%s &gt; %s' % (self._get_value(pk1), self._get_value(pk2))
 
-        if value1 == value2:
-            if url1:
-                return '<a href="%(url)s">%(value)s</a>' % {'url': url1, 'value':value1}
-            return value1
 
-        try:
-            url2 = reverse( 'admin:%s_%s_change' % (rel_to._meta.app_label, rel_to._meta.object_name.lower()),args=[pk2] ) 
-        except NoReverseMatch:
-            url2 = None
-        
-        if url1:
-            return ('<a href="%(url)s">%(value)s</a>' % {'url': url1, 'value':value1})+ ' &gt; ' +('<a href="%(url)s">%(value)s</a>' % {'url': url2, 'value':value2})
-        return value1+' &gt; '+value2
-        
 class FileChange(BaseChange):
     
     @property
@@ -66,13 +129,19 @@ class TextChange(BaseChange):
 
     @property
     def diff(self):
+        from moderation.conf import settings
+
         value1, value2 = escape(self.change[0]), escape(self.change[1])
         if value1 == value2:
             return value1
 
+        diff_operations = get_diff_operations(*self.change)
+        if settings.RENDER_DIFF_WITHOUT_TEMPLATE:
+            return render_diff_operations(diff_operations)
+
         return self.render_diff(
             'moderation/html_diff.html',
-                {'diff_operations': get_diff_operations(*self.change)})
+                {'diff_operations': diff_operations})
 
 
 
@@ -86,7 +155,34 @@ class ImageChange(BaseChange):
                  'right_image': right_image})
 
 
-def get_change(model1, model2, field):
+class RenderedChange(BaseChange):
+    """Change with diff rendered in advance, it does not refer to models,
+       so it can be stored in cache
+    """
+
+    def __init__(self, verbose_name, change, diff):
+        super(RenderedChange, self).__init__(verbose_name, None, change)
+        self.diff = diff
+
+
+def render_changes(changes):
+    """Returns list of RenderedChange objects for changes"""
+    rendered_changes = []
+    for change in changes:
+        values = []
+        for value in change.change:
+            if isinstance(value, FieldFile):
+                value = value.name
+            values.append(value)
+
+        rendered_changes.append(RenderedChange(
+            force_unicode(change.verbose_name), tuple(values),
+            force_unicode(change.diff)))
+
+    return rendered_changes
+
+
+def get_change(model1, model2, field, resolver=None):
     try:
         value1 = getattr(model1, "get_%s_display" % field.name)()
         value2 = getattr(model2, "get_%s_display" % field.name)()
@@ -98,6 +194,7 @@ def get_change(model1, model2, field):
         field.verbose_name,
             (value1, value2),
         field,
+        resolver,
         )
 
     return change
@@ -105,6 +202,8 @@ def get_change(model1, model2, field):
 
 def get_changes_between_models(model1, model2, excludes=[]):
     changes = {}
+    # Related objects of all foreign key changes are loaded together
+    resolver = ForeignKeyResolver()
 
     for field in model1._meta.fields:
         if not (isinstance(field, (fields.AutoField,))):
@@ -113,19 +212,71 @@ def get_changes_between_models(model1, model2, excludes=[]):
 
             name = u"%s__%s" % (model1.__class__.__name__.lower(), field.name)
 
-            changes[name] = get_change(model1, model2, field)
+            changes[name] = get_change(model1, model2, field, resolver)
 
     return changes
 
 
+def has_changes_between_models(model1, model2, excludes=[]):
+    """Returns True if any field of models differs. Raw values of fields
+       are compared and comparison stops at first difference, so related
+       objects are not fetched and no change objects are built. Values
+       that are not equal are compared as text, as in changes returned
+       by get_changes_between_models
+    """
+    for field in model1._meta.fields:
+        if isinstance(field, fields.AutoField) or field.name in excludes:
+            continue
+
+        value1 = getattr(model1, field.attname)
+        value2 = getattr(model2, field.attname)
+        if value1 != value2 and force_unicode(value1) != force_unicode(value2):
+            return True
+
+    return False
+
+
+def get_fingerprint(model):
+    """Returns sha1 hex digest of values of all model fields, values are
+       converted the same way as by serializers so fingerprint of
+       deserialized object is equal to fingerprint of its original
+    """
+    values = []
+
+    for field in model._meta.fields:
+        if not (isinstance(field, (fields.AutoField,))):
+            values.append(u"%s=%s" % (field.attname,
+                                      field.value_to_string(model)))
+
+    return sha_constructor(smart_str(u"\x00".join(values))).hexdigest()
+
+
 def get_diff_operations(a, b):
-    operations = []
+    """Returns operations that change words of text a to words of text b.
+       Texts with more words than DJANGO_MODERATION_DIFF_MAX_TOKENS, or
+       which words could not be compared within DJANGO_MODERATION_DIFF_TIMEOUT
+       seconds, are compared by lines
+    """
+    from moderation.conf import settings
+
     a_words = re.split('(\W+)', a)
     b_words = re.split('(\W+)', b)
-    sequence_matcher = difflib.SequenceMatcher(None, a_words, b_words)
-    for opcode in sequence_matcher.get_opcodes():
-        operation, start_a, end_a, start_b, end_b = opcode
 
+    complete = False
+    if settings.DIFF_MAX_TOKENS is None or\
+       len(a_words) + len(b_words) <= settings.DIFF_MAX_TOKENS:
+        blocks, complete = get_matching_blocks(a_words, b_words,
+                                               get_diff_deadline())
+    if not complete:
+        a_words = a.splitlines(True)
+        b_words = b.splitlines(True)
+        # Lines that were not compared in time are shown as replaced
+        blocks, complete = get_matching_blocks(a_words, b_words,
+                                               get_diff_deadline())
+
+    operations = []
+    for operation, start_a, end_a, start_b, end_b in\
+            get_opcodes(blocks, len(a_words), len(b_words)):
         deleted = ''.join(a_words[start_a:end_a])
         inserted = ''.join(b_words[start_b:end_b])
 
@@ -135,6 +286,216 @@ def get_diff_operations(a, b):
     return operations
 
 
+DIFF_OPERATION_FORMATS = {
+    'replace': u'<del class="diff modified">%(deleted)s</del>'
+               u'<ins class="diff modified">%(inserted)s</ins>',
+    'delete': u'<del class="diff">%(deleted)s</del>',
+    'insert': u'<ins class="diff">%(inserted)s</ins>',
+    'equal': u'<span>%(inserted)s</span>',
+}
+
+_whitespace_re = re.compile(r'^\s+$')
+
+
+def _escape_diff_text(text):
+    text = conditional_escape(text)
+    if _whitespace_re.match(text):
+        # spaceless tag of template removes whitespace between tags
+        return u''
+    return text
+
+
+def render_diff_operations(diff_operations):
+    """Returns the same markup as moderation/html_diff.html template
+       for diff operations, without template engine
+    """
+    parts = []
+    for operation in diff_operations:
+        format = DIFF_OPERATION_FORMATS.get(operation['operation'])
+        if format is not None:
+            parts.append(format % {
+                'deleted': _escape_diff_text(operation['deleted']),
+                'inserted': _escape_diff_text(operation['inserted'])})
+    parts.append(u'\n')
+
+    return mark_safe(u''.join(parts))
+
+
+def get_diff_deadline():
+    from moderation.conf import settings
+
+    if settings.DIFF_TIMEOUT is None:
+        return None
+
+    return time.time() + settings.DIFF_TIMEOUT
+
+
+def get_matching_blocks(a, b, deadline=None):
+    """Returns list of (i, j, n) triples of matching items of sequences
+       a[i:i + n] == b[j:j + n], found by linear space Myers algorithm,
+       and False if comparison was stopped at deadline, items that were not
+       compared then are not matched
+    """
+    blocks = []
+    complete = _match_blocks(a, 0, len(a), b, 0, len(b), deadline, blocks)
+    blocks.sort()
+
+    merged = []
+    for i, j, n in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and\
+           merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + n)
+        else:
+            merged.append((i, j, n))
+
+    return merged, complete
+
+
+def get_opcodes(blocks, len_a, len_b):
+    """Returns operations in the same format as
+       difflib.SequenceMatcher.get_opcodes for matching blocks
+    """
+    opcodes = []
+    i = j = 0
+    for start_a, start_b, size in blocks + [(len_a, len_b, 0)]:
+        if i < start_a and j < start_b:
+            opcodes.append(('replace', i, start_a, j, start_b))
+        elif i < start_a:
+            opcodes.append(('delete', i, start_a, j, start_b))
+        elif j < start_b:
+            opcodes.append(('insert', i, start_a, j, start_b))
+
+        i, j = start_a + size, start_b + size
+        if size:
+            opcodes.append(('equal', start_a, i, start_b, j))
+
+    return opcodes
+
+
+def _match_blocks(a, alo, ahi, b, blo, bhi, deadline, blocks):
+    # Common prefix and suffix are matched without searching
+    prefix = 0
+    while alo + prefix < ahi and blo + prefix < bhi and\
+          a[alo + prefix] == b[blo + prefix]:
+        prefix += 1
+    if prefix:
+        blocks.append((alo, blo, prefix))
+        alo += prefix
+        blo += prefix
+
+    suffix = 0
+    while ahi - suffix > alo and bhi - suffix > blo and\
+          a[ahi - suffix - 1] == b[bhi - suffix - 1]:
+        suffix += 1
+    if suffix:
+        blocks.append((ahi - suffix, bhi - suffix, suffix))
+        ahi -= suffix
+        bhi -= suffix
+
+    if alo == ahi or blo == bhi:
+        return True
+
+    if ahi - alo == 1 or bhi - blo == 1:
+        # Single item could match only once
+        for i in range(alo, ahi):
+            for j in range(blo, bhi):
+                if a[i] == b[j]:
+                    blocks.append((i, j, 1))
+                    return True
+        return True
+
+    if deadline is not None and time.time() > deadline:
+        return False
+
+    split = _bisect(a, alo, ahi, b, blo, bhi, deadline)
+    if split is None:
+        return False
+    if split is _NO_COMMON_ITEMS:
+        # Items of the sequences are all replaced
+        return True
+
+    x, y = split
+    left = _match_blocks(a, alo, x, b, blo, y, deadline, blocks)
+    right = _match_blocks(a, x, ahi, b, y, bhi, deadline, blocks)
+    return left and right
+
+
+_NO_COMMON_ITEMS = object()
+
+
+def _bisect(a, alo, ahi, b, blo, bhi, deadline):
+    """Finds middle snake of shortest edit script, returns point at which
+       the sequences are split, _NO_COMMON_ITEMS when the sequences have
+       no common item or None when deadline was reached
+    """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    length = 2 * max_d
+    forward = [-1] * length
+    forward[offset + 1] = 0
+    reverse = forward[:]
+    delta = n - m
+    # Paths meet in forward pass when delta is odd
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+
+    for d in xrange(max_d):
+        if deadline is not None and time.time() > deadline:
+            return None
+
+        for k1 in xrange(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and
+                            forward[k1_offset - 1] < forward[k1_offset + 1]):
+                x1 = forward[k1_offset + 1]
+            else:
+                x1 = forward[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = offset + delta - k1
+                if 0 <= k2_offset < length and reverse[k2_offset] != -1 and\
+                   x1 >= n - reverse[k2_offset]:
+                    return alo + x1, blo + y1
+
+        for k2 in xrange(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and
+                            reverse[k2_offset - 1] < reverse[k2_offset + 1]):
+                x2 = reverse[k2_offset + 1]
+            else:
+                x2 = reverse[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and\
+                  a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            reverse[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < length and forward[k1_offset] != -1:
+                    x1 = forward[k1_offset]
+                    y1 = offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return alo + x1, blo + y1
+
+    # Paths did not meet, no item of a is in b
+    return _NO_COMMON_ITEMS
+
+
 def html_to_list(html):
     pattern = re.compile(r'&.*?;|(?:<[^<]*?>)|'\
                          '(?:\w[\w-]*[ ]*)|(?:<[^<]*?>)|'\
@@ -144,7 +505,7 @@ def html_to_list(html):
                                                    pattern.findall(html))]
 
 
-def get_change_for_type(verbose_name, change, field):
+def get_change_for_type(verbose_name, change, field, resolver=None):
     if isinstance(field, fields.files.ImageField):
         change = ImageChange(
             u"Current %(verbose_name)s / "\
@@ -152,8 +513,7 @@ def get_change_for_type(verbose_name, change, field):
             field,
             change)
     elif isinstance(field, ForeignKey):
-        value1, value2 = change
-        change = ForeignKeyChange(verbose_name, field, (unicode(value1), unicode(value2)))
+        change = ForeignKeyChange(verbose_name, field, change, resolver)
     elif isinstance(field, FileField):
         value1, value2 = change
         change = FileChange(verbose_name, field, (value1, value2))
@@ -1,8 +1,47 @@
+import base64
+import zlib
+
+from django.core.serializers.base import DeserializationError
 from django.db import models
-from django.conf import settings
-from django.core import serializers
-from django.core.exceptions import ObjectDoesNotExist
 from django.db.models.query import QuerySet
+from django.db.models.query_utils import DeferredAttribute
+from django.utils.encoding import force_unicode, smart_str
+
+from moderation.serialization import get_codec
+
+
+class SerializedObjectDescriptor(object):
+    '''Keeps serialized value of SerializedObjectField loaded from database
+       in instance and deserializes it on first access
+    '''
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        cache_name = self.field.get_cache_name()
+        try:
+            return instance.__dict__[cache_name]
+        except KeyError:
+            value = instance.__dict__.get(self.field.attname)
+            if value:
+                value = self.field._deserialize(value)
+            else:
+                value = None
+            instance.__dict__[cache_name] = value
+            return value
+
+    def __set__(self, instance, value):
+        if isinstance(value, basestring):
+            # Serialized value, e.g. loaded from database
+            instance.__dict__[self.field.attname] = value
+            instance.__dict__.pop(self.field.get_cache_name(), None)
+        else:
+            instance.__dict__[self.field.get_cache_name()] = value
+            instance.__dict__.pop(self.field.attname, None)
 
 
 class SerializedObjectField(models.TextField):
@@ -30,62 +69,236 @@ class SerializedObjectField(models.TextField):
 
     '''
 
-    def __init__(self, serialize_format='json', *args, **kwargs):
+    header_prefix = '#!'
+    header_suffix = ':'
+    compression_header = '#!z:'
+    blob_header = '#!blob:'
+
+    def __init__(self, serialize_format='json', codec=None,
+                 compress_threshold=None, store_delta=None,
+                 blob_threshold=None, *args, **kwargs):
         self.serialize_format = serialize_format
+        self.codec = codec
+        self.compress_threshold = compress_threshold
+        self.store_delta = store_delta
+        self.blob_threshold = blob_threshold
         super(SerializedObjectField, self).__init__(*args, **kwargs)
 
+    def _get_codec_name(self):
+        from moderation.conf import settings as moderation_settings
+
+        return self.codec or moderation_settings.CODEC or\
+            self.serialize_format
+
+    def stores_delta(self):
+        """Returns True if values are stored as delta against live object
+           when possible
+        """
+        from moderation.conf import settings as moderation_settings
+
+        if self.store_delta is not None:
+            return self.store_delta
+
+        return moderation_settings.STORE_DELTA
+
+    def _get_compress_threshold(self):
+        from moderation.conf import settings as moderation_settings
+
+        if self.compress_threshold is not None:
+            return self.compress_threshold
+
+        return moderation_settings.COMPRESS_THRESHOLD
+
+    def _get_blob_threshold(self):
+        from moderation.conf import settings as moderation_settings
+
+        if self.blob_threshold is not None:
+            return self.blob_threshold
+
+        return moderation_settings.BLOB_THRESHOLD
+
+    def _compress(self, value):
+        """Compresses serialized value if it is not shorter than
+           compress threshold, compressed value starts with
+           compression header
+        """
+        threshold = self._get_compress_threshold()
+        if threshold is None or len(value) < threshold:
+            return value
+
+        compressed = '%s%s' % (self.compression_header,
+                               base64.b64encode(zlib.compress(
+                                   smart_str(value))))
+        if len(compressed) >= len(value):
+            return value
+
+        return compressed
+
+    def _decompress(self, value):
+        if value.startswith(self.compression_header):
+            value = zlib.decompress(base64.b64decode(
+                value[len(self.compression_header):]))
+            return force_unicode(value)
+
+        return value
+
+    def _store_blob(self, value):
+        """Stores serialized value in blob storage if it is not shorter
+           than blob threshold, only reference to blob is returned then
+        """
+        from moderation.storage import get_blob_storage
+
+        threshold = self._get_blob_threshold()
+        if threshold is None or len(value) < threshold:
+            return value
+
+        key = get_blob_storage().save(smart_str(value))
+        return '%s%s' % (self.blob_header, key)
+
+    def get_blob_key(self, value):
+        """Returns key of blob that keeps serialized value or None if value
+           is not stored in blob storage
+        """
+        if value and value.startswith(self.blob_header):
+            return value[len(self.blob_header):]
+
+        return None
+
+    def _load_blob(self, value):
+        from moderation.storage import get_blob_storage
+
+        key = self.get_blob_key(value)
+        if key is None:
+            return value
+
+        try:
+            value = get_blob_storage().load(key)
+        except (IOError, OSError), e:
+            raise DeserializationError(u"Blob %s of serialized object can "
+                                       u"not be loaded: %s" % (key, e))
+
+        return force_unicode(value)
+
     def _serialize(self, value):
         if not value:
             return ''
 
-        value_set = [value]
-        if value._meta.parents:
-            value_set += [getattr(value, f.name)
-                          for f in value._meta.parents.values()]
+        value_set = [value] + self._get_parent_objects(value)
+
+        if self.stores_delta():
+            delta = get_codec('delta').encode(value_set)
+            if delta is not None:
+                return self._store_blob(
+                    self._compress(self._add_header('delta', delta)))
+
+        codec_name = self._get_codec_name()
+        codec = get_codec(codec_name)
+        value = codec.encode(value_set)
+
+        if codec.header:
+            value = self._add_header(codec_name, value)
+
+        return self._store_blob(self._compress(value))
+
+    def _get_parent_objects(self, value):
+        """Returns instances of all parent models of multi-table
+           inheritance, built from fields of value without queries
+        """
+        parents = []
+        parent_models = list(value._meta.parents.keys())
+        while parent_models:
+            model = parent_models.pop(0)
+            if model in [parent.__class__ for parent in parents]:
+                continue
+            parents.append(model(**dict([(f.attname, getattr(value, f.attname))
+                                         for f in model._meta.fields])))
+            parent_models += model._meta.parents.keys()
+
+        return parents
+
+    def _add_header(self, codec_name, value):
+        return '%s%s%s%s' % (self.header_prefix, codec_name,
+                             self.header_suffix, value)
 
-        return serializers.serialize(self.serialize_format, value_set)
+    def _split_header(self, value):
+        """Returns codec name and payload of serialized value, values
+           without header are serialized with serialize_format
+        """
+        if value.startswith(self.header_prefix):
+            codec_name, payload = value[len(self.header_prefix):].split(
+                self.header_suffix, 1)
+            return codec_name, payload
+
+        return self.serialize_format, value
 
     def _deserialize(self, value):
-        obj_generator = serializers.deserialize(self.serialize_format,
-                                       value.encode(settings.DEFAULT_CHARSET))
-
-        obj = obj_generator.next().object
-        for parent in obj_generator:
-            for f in parent.object._meta.fields:
-                try:
-                    setattr(obj, f.name, getattr(parent.object, f.name))
-                except ObjectDoesNotExist:
-                    try:
-                        # Try to set non-existant foreign key reference to None
-                        setattr(obj, f.name, None)
-                    except ValueError:
-                        # Return None for changed_object if None not allowed
-                        return None
+        from moderation.cache import deserialized_objects_cache
+
+        key = deserialized_objects_cache.get_key(self.serialize_format, value)
+        obj = deserialized_objects_cache.get(key)
+        if obj is not None:
+            return obj
+
+        codec_name, payload = self._split_header(
+            self._decompress(self._load_blob(value)))
+        obj = self._decode(codec_name, payload)
+
+        if obj is not None and codec_name != 'delta':
+            # Objects stored as delta depend on live object
+            deserialized_objects_cache.set(key, obj)
+
+        return obj
+
+    def _decode(self, codec_name, value):
+        obj_list = get_codec(codec_name).decode(value)
+
+        obj = obj_list[0]
+        for parent in obj_list[1:]:
+            # Fields are copied by attname, so related objects are not
+            # fetched, same as for fields of child model
+            for f in parent._meta.fields:
+                setattr(obj, f.attname, getattr(parent, f.attname))
         return obj
 
     def db_type(self, connection=None):
         return 'text'
 
+    def has_serialized_value(self, model_instance):
+        """Returns True if value of field was not assigned since it was
+           loaded from database or saved, so serialized value is up to date
+        """
+        return isinstance(model_instance.__dict__.get(self.attname),
+                          basestring)
+
+    def is_deserialized(self, model_instance):
+        """Returns True if value of field was accessed or assigned"""
+        return self.get_cache_name() in model_instance.__dict__
+
+    def is_deferred(self, model_instance):
+        """Returns True if loading of field was deferred and value was not
+           loaded yet, so stored value was not changed
+        """
+        return self.attname not in model_instance.__dict__ and\
+            isinstance(model_instance.__class__.__dict__.get(self.attname),
+                       DeferredAttribute)
+
     def pre_save(self, model_instance, add):
-        value = getattr(model_instance, self.attname, None)
-        return self._serialize(value)
+        if not self.is_deserialized(model_instance) and\
+           self.has_serialized_value(model_instance):
+            # Value has not been deserialized, so it could not be changed
+            return model_instance.__dict__[self.attname]
+
+        value = self._serialize(getattr(model_instance, self.attname, None))
+        if not isinstance(model_instance.__class__.__dict__.get(self.attname),
+                          DeferredAttribute):
+            # Deferred attribute keeps deserialized value in the same place
+            model_instance.__dict__[self.attname] = value
+        return value
 
     def contribute_to_class(self, cls, name):
         self.class_name = cls
         super(SerializedObjectField, self).contribute_to_class(cls, name)
-        models.signals.post_init.connect(self.post_init)
-
-    def post_init(self, **kwargs):
-        if 'sender' in kwargs and 'instance' in kwargs:
-            if kwargs['sender'] == self.class_name and\
-               hasattr(kwargs['instance'], self.attname):
-                value = self.value_from_object(kwargs['instance'])
-
-                if value:
-                    setattr(kwargs['instance'], self.attname,
-                            self._deserialize(value))
-                else:
-                    setattr(kwargs['instance'], self.attname, None)
+        setattr(cls, self.attname, SerializedObjectDescriptor(self))
 
 
 try:
@@ -97,6 +310,11 @@ try:
             [],  # Positional arguments (not used)
                 {  # Keyword argument
                  "serialize_format": ["serialize_format", {"default": "json"}],
+                 "codec": ["codec", {"default": None}],
+                 "compress_threshold": ["compress_threshold",
+                                        {"default": None}],
+                 "store_delta": ["store_delta", {"default": None}],
+                 "blob_threshold": ["blob_threshold", {"default": None}],
                  },
             ),
              ], ["^moderation\.fields\.SerializedObjectField"])
@@ -16,6 +16,110 @@ def automoderate(instance, user):
     return status
 
 
+def prefetch_moderated_objects(instances):
+    '''
+    Loads ModeratedObject of every given model instance with single query
+    for every model and stores it on instance, so moderated_object property
+    does not query database again. Returns list of instances
+    '''
+    from django.contrib.contenttypes.models import ContentType
+    from moderation.conf import settings
+    from moderation.models import ModeratedObject
+
+    instances = list(instances)
+
+    instances_by_model = {}
+    for instance in instances:
+        if instance.pk is not None:
+            instances_by_model.setdefault(instance.__class__, {})\
+                .setdefault(instance.pk, []).append(instance)
+
+    for model_class, instances_by_pk in instances_by_model.items():
+        content_type = ContentType.objects.get_for_model(model_class)
+        pks = instances_by_pk.keys()
+        moderated_objects = {}
+
+        for i in range(0, len(pks), settings.FILTER_CHUNK_SIZE):
+            for moderated_object in ModeratedObject.objects.filter(
+                    content_type=content_type,
+                    object_pk__in=pks[i:i + settings.FILTER_CHUNK_SIZE]):
+                moderated_objects.setdefault(moderated_object.object_pk,
+                                             []).append(moderated_object)
+
+        for pk, objects in moderated_objects.items():
+            if len(objects) != 1:
+                # Leave it for moderated_object property to raise
+                # MultipleObjectsReturned
+                continue
+
+            for instance in instances_by_pk[pk]:
+                objects[0]._content_object_cache = instance
+                instance._moderated_object = objects[0]
+
+    return instances
+
+
+def prefetch_moderated_related(instances, related_name):
+    '''
+    Loads objects of moderated model related to given instances through
+    related manager related_name. Moderation filter is applied once for
+    related objects of all instances, instead of once for every instance.
+    Returns dictionary with list of related objects for every instance pk
+    '''
+    from django.utils.encoding import force_unicode
+    from moderation import moderation
+    import re
+
+    instances = list(instances)
+    if not instances:
+        return {}
+
+    related_managers = [getattr(instance, related_name)
+                        for instance in instances]
+    model = related_managers[0].model
+    manager = getattr(model, moderation.get_moderator(model).manager_names[0])
+
+    # Related managers of reverse foreign keys, many to many fields and
+    # generic relations filter related objects by their core_filters
+    lookups = sorted(related_managers[0].core_filters.keys())
+    fields = [re.sub('__exact$', '', lookup) for lookup in lookups]
+
+    def get_key(values):
+        return tuple([force_unicode(value) for value in values])
+
+    filters = {}
+    for related_manager in related_managers:
+        for lookup, field in zip(lookups, fields):
+            filters.setdefault('%s__in' % field, set()).add(
+                related_manager.core_filters[lookup])
+
+    query_set = manager.filter_moderated_objects(
+        model._base_manager.filter(**filters))
+
+    keys = {}
+    for row in query_set.values_list('pk', *fields):
+        keys.setdefault(row[0], []).append(get_key(row[1:]))
+
+    related_objects = {}
+    loaded_pks = set()
+    for obj in query_set:
+        if obj.pk in loaded_pks:
+            # Objects related to many instances are joined many times
+            continue
+        loaded_pks.add(obj.pk)
+
+        for key in keys.get(obj.pk, []):
+            related_objects.setdefault(key, []).append(obj)
+
+    result = {}
+    for instance, related_manager in zip(instances, related_managers):
+        key = get_key([related_manager.core_filters[lookup]
+                       for lookup in lookups])
+        result[instance.pk] = related_objects.get(key, [])
+
+    return result
+
+
 def import_moderator(app):
     '''
     Import moderator module and register all models it contains with moderation
@@ -0,0 +1,79 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Deletes blobs of changed objects that are not referenced by "\
+           "any moderated object. Blobs saved recently are kept, they "\
+           "could belong to moderated objects that are being saved."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--min-age', action='store', dest='min_age',
+                    type='int', default=3600,
+                    help='Delete only blobs that were not saved '
+                         'in given number of seconds.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    default=False,
+                    help='Count unused blobs without deleting them.'),
+    )
+
+    def handle(self, *args, **options):
+        from moderation.models import ModeratedObject
+        from moderation.storage import get_blob_storage
+
+        field = ModeratedObject._meta.get_field('changed_object')
+        storage = get_blob_storage()
+        verbosity = int(options.get('verbosity', 1))
+        dry_run = options['dry_run']
+        stdout = getattr(self, 'stdout', sys.stdout)
+        saved_before = time.time() - options['min_age']
+
+        # Blobs are listed before references are read, so blobs of
+        # moderated objects saved in the meantime are not deleted
+        keys = []
+        for key in storage.keys():
+            modified_time = self.get_modified_time(storage, key)
+            if modified_time is not None and modified_time < saved_before:
+                keys.append(key)
+
+        referenced_keys = set()
+        values = ModeratedObject.objects\
+            .filter(changed_object__startswith=field.blob_header)\
+            .values_list('changed_object', flat=True)
+        for value in values.iterator():
+            referenced_keys.add(field.get_blob_key(value))
+
+        deleted = 0
+        for key in keys:
+            if key in referenced_keys:
+                continue
+            modified_time = self.get_modified_time(storage, key)
+            if modified_time is None or modified_time >= saved_before:
+                # Blob was deleted or saved again while references were read
+                continue
+            if not dry_run:
+                try:
+                    storage.delete(key)
+                except OSError:
+                    # Blob was deleted by other process
+                    continue
+            deleted += 1
+
+        if verbosity:
+            if dry_run:
+                action = "Found"
+            else:
+                action = "Deleted"
+            stdout.write("%s %d unused blobs, %d blobs are referenced by "
+                         "moderated objects\n" % (action, deleted,
+                                                  len(referenced_keys)))
+
+    def get_modified_time(self, storage, key):
+        """Returns time of last save of blob or None if it was deleted"""
+        try:
+            return storage.get_modified_time(key)
+        except OSError:
+            return None
@@ -0,0 +1,123 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import reset_queries, transaction
+
+
+class Command(BaseCommand):
+    help = "Rewrites changed objects of moderated objects with current "\
+           "codec and current fields of models. Moderated objects are "\
+           "processed in batches ordered by pk, every batch is committed "\
+           "separately, so the command can be resumed with --start-after."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', action='store', dest='batch_size',
+                    type='int', default=500,
+                    help='Number of moderated objects processed '
+                         'in single transaction.'),
+        make_option('--start-after', action='store', dest='start_after',
+                    type='int', default=0,
+                    help='Process only moderated objects with pk '
+                         'greater than given one.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    default=False,
+                    help='Count changed objects that would be rewritten '
+                         'without saving them.'),
+    )
+
+    def handle(self, *args, **options):
+        from moderation.models import ModeratedObject
+
+        self.field = ModeratedObject._meta.get_field('changed_object')
+        self.verbosity = int(options.get('verbosity', 1))
+        self.dry_run = options['dry_run']
+        self.stdout = getattr(self, 'stdout', sys.stdout)
+        self.stderr = getattr(self, 'stderr', sys.stderr)
+
+        batch_size = options['batch_size']
+        last_pk = options['start_after']
+        processed = rewritten = failed = 0
+        started = time.time()
+
+        while True:
+            rows = list(ModeratedObject.objects.filter(pk__gt=last_pk)
+                        .order_by('pk')
+                        .values_list('pk', 'changed_object',
+                                     'changed_object_fingerprint',
+                                     'changed_object_summary')
+                        [:batch_size])
+            if not rows:
+                break
+
+            batch_rewritten, batch_failed = self.process_batch(rows)
+            # Queries are stored in memory when DEBUG is True
+            reset_queries()
+
+            last_pk = rows[-1][0]
+            processed += len(rows)
+            rewritten += batch_rewritten
+            failed += batch_failed
+
+            if self.verbosity:
+                # Batch is committed, reported pk can be used to resume
+                self.report(processed, rewritten, failed, last_pk, started)
+
+        if self.verbosity and not processed:
+            self.report(processed, rewritten, failed, last_pk, started)
+
+    def report(self, processed, rewritten, failed, last_pk, started):
+        elapsed = max(time.time() - started, 0.001)
+        self.stdout.write(
+            "Processed %d moderated objects up to pk %s, rewritten %d, "
+            "failed %d (%.1f objects/s)\n" % (processed, last_pk, rewritten,
+                                              failed, processed / elapsed))
+        self.stdout.flush()
+
+    def process_batch(self, rows):
+        if self.dry_run:
+            return self._process_batch(rows)
+
+        return transaction.commit_on_success(self._process_batch)(rows)
+
+    def _process_batch(self, rows):
+        from moderation.diff import get_fingerprint
+        from moderation.models import ModeratedObject, get_summary
+
+        rewritten = failed = 0
+
+        for pk, value, fingerprint, summary in rows:
+            if not value:
+                continue
+
+            try:
+                obj = self.field._deserialize(value)
+            except Exception, e:
+                failed += 1
+                self.stderr.write(u"Moderated object %s can not be "
+                                  u"deserialized: %s\n" % (pk, e))
+                continue
+
+            if obj is None:
+                continue
+
+            updates = {}
+            new_value = self.field._serialize(obj)
+            if new_value != value:
+                updates['changed_object'] = new_value
+
+            new_fingerprint = get_fingerprint(obj)
+            if new_fingerprint != fingerprint:
+                updates['changed_object_fingerprint'] = new_fingerprint
+
+            new_summary = get_summary(obj)
+            if new_summary != summary:
+                updates['changed_object_summary'] = new_summary
+
+            if updates:
+                rewritten += 1
+                if not self.dry_run:
+                    ModeratedObject.objects.filter(pk=pk).update(**updates)
+
+        return rewritten, failed
@@ -1,6 +1,6 @@
 from django.db.models.manager import Manager
+from django.db.models.query import QuerySet, ValuesQuerySet, DateQuerySet
 from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import ObjectDoesNotExist
 
 
 class MetaClass(type):
@@ -9,6 +9,104 @@ class MetaClass(type):
         return super(MetaClass, cls).__new__(cls, name, bases, attrs)
 
 
+class ModerationQuerySet(QuerySet):
+    """QuerySet that excludes objects hidden by moderation only when it is
+       evaluated, so moderation filter is applied to the query_set already
+       filtered by the caller
+    """
+
+    def __init__(self, model=None, query=None, using=None,
+                 moderation_filter=None):
+        super(ModerationQuerySet, self).__init__(model, query, using)
+        self.moderation_filter = moderation_filter
+        self._prefetch_moderated_objects = False
+
+    def __getstate__(self):
+        obj_dict = super(ModerationQuerySet, self).__getstate__()
+        # Results are already cached, moderation filter is not needed
+        obj_dict['moderation_filter'] = None
+        return obj_dict
+
+    def _clone(self, klass=None, setup=False, **kwargs):
+        if self.moderation_filter is not None and klass is not None\
+           and issubclass(klass, (ValuesQuerySet, DateQuerySet)):
+            # values(), values_list() and dates() return instances of
+            # other QuerySet classes, so moderation is applied first
+            return self._moderated()._clone(klass, setup, **kwargs)
+
+        kwargs.setdefault('moderation_filter', self.moderation_filter)
+        kwargs.setdefault('_prefetch_moderated_objects',
+                          self._prefetch_moderated_objects)
+
+        return super(ModerationQuerySet, self)._clone(klass, setup, **kwargs)
+
+    def _moderated(self):
+        """Returns query_set with moderation filter applied,
+           slicing of query_set is applied after filtering
+        """
+        query_set = self._clone(moderation_filter=None,
+                                _prefetch_moderated_objects=False)
+        low_mark = query_set.query.low_mark
+        high_mark = query_set.query.high_mark
+        query_set.query.clear_limits()
+
+        query_set = self.moderation_filter(query_set)
+        query_set.query.set_limits(low_mark, high_mark)
+
+        return query_set
+
+    def prefetch_moderated_objects(self):
+        """Returns new query_set that loads ModeratedObject of all
+           its objects with single query when it is evaluated
+        """
+        return self._clone(_prefetch_moderated_objects=True)
+
+    def iterator(self):
+        if self.moderation_filter is None:
+            iterator = super(ModerationQuerySet, self).iterator()
+        else:
+            iterator = self._moderated().iterator()
+
+        if self._prefetch_moderated_objects:
+            from moderation.helpers import prefetch_moderated_objects
+
+            return iter(prefetch_moderated_objects(iterator))
+
+        return iterator
+
+    def count(self):
+        if self.moderation_filter is None or self._result_cache is not None:
+            return super(ModerationQuerySet, self).count()
+
+        # Objects are excluded by the same filter as when iterating,
+        # only the remaining rows are counted in database
+        return self._moderated().count()
+
+    def exists(self):
+        if self.moderation_filter is None or self._result_cache is not None:
+            return super(ModerationQuerySet, self).exists()
+
+        return self._moderated().exists()
+
+    def aggregate(self, *args, **kwargs):
+        if self.moderation_filter is None:
+            return super(ModerationQuerySet, self).aggregate(*args, **kwargs)
+
+        return self._moderated().aggregate(*args, **kwargs)
+
+    def update(self, **kwargs):
+        if self.moderation_filter is None:
+            return super(ModerationQuerySet, self).update(**kwargs)
+
+        return self._moderated().update(**kwargs)
+
+    def delete(self):
+        if self.moderation_filter is None:
+            return super(ModerationQuerySet, self).delete()
+
+        return self._moderated().delete()
+
+
 class ModerationObjectsManager(Manager):
 
     def __call__(self, base_manager, *args, **kwargs):
@@ -17,40 +115,110 @@ class ModerationObjectsManager(Manager):
                 {'use_for_related_fields': True})
 
     def filter_moderated_objects(self, query_set):
-        from moderation.models import MODERATION_STATUS_PENDING,\
-            MODERATION_STATUS_REJECTED
+        from moderation.cache import excluded_objects_memo
 
-        exclude_pks = []
+        if excluded_objects_memo.active:
+            exclude_pks = self.get_memoized_excluded_pks(query_set)
+        elif self.moderator.cache_excluded_objects:
+            exclude_pks = self.get_cached_excluded_pks()
+        else:
+            exclude_pks = self.get_excluded_pks(query_set)
+
+        return query_set.exclude(pk__in=exclude_pks)
+
+    def get_memoized_excluded_pks(self, query_set):
+        """Returns pks of objects from query_set that should not be publicly
+           visible, they are memoized until the end of current request
+           or until any object of model is saved or moderated.
+           Pks of all objects of model are computed only for query_set
+           without filter, filtered query_set is compared by its own
+           objects and memoized under key of its filter
+        """
+        from moderation.cache import excluded_objects_memo
+
+        exclude_pks = excluded_objects_memo.get(self.model)
+        if exclude_pks is not None:
+            return exclude_pks
+
+        if query_set.query.where and\
+           not self.moderator.cache_excluded_objects:
+            key = self._get_filter_key(query_set)
+            exclude_pks = excluded_objects_memo.get(self.model, key)
+            if exclude_pks is None:
+                exclude_pks = self.get_excluded_pks(query_set)
+                excluded_objects_memo.set(self.model, exclude_pks, key)
+            return exclude_pks
+
+        if self.moderator.cache_excluded_objects:
+            exclude_pks = self.get_cached_excluded_pks()
+        else:
+            exclude_pks = self.get_excluded_pks(
+                self.model._base_manager.all())
+        excluded_objects_memo.set(self.model, exclude_pks)
+
+        return exclude_pks
+
+    def _get_filter_key(self, query_set):
+        query = query_set.order_by().values_list('pk', flat=True).query
+        sql, params = query.get_compiler(using=query_set.db).as_sql()
+        return sql, tuple(params)
+
+    def get_cached_excluded_pks(self):
+        """Returns pks of all objects of model that should not be publicly
+           visible, they are stored in cache until any object of model is
+           saved or moderated
+        """
+        from moderation.cache import excluded_objects_cache
+
+        exclude_pks = excluded_objects_cache.get(self.model)
+
+        if exclude_pks is None:
+            exclude_pks = self.get_excluded_pks(
+                self.model._base_manager.all())
+            excluded_objects_cache.set(self.model, exclude_pks)
 
-        from models import ModeratedObject
+        return exclude_pks
 
-        # TODO: Load this query in chunks to avoid huge RAM usage spikes
-        mobjects = dict([(mobject.object_pk, mobject)\
-        for mobject in ModeratedObject.objects.filter(
+    def get_excluded_pks(self, query_set):
+        """Returns list of pks of objects from query_set that should not be
+           publicly visible. Only objects with pending or rejected moderated
+           object are compared, they are loaded in chunks ordered by pk.
+           Objects are compared by fingerprints, changed_object is loaded
+           only for moderated objects without fingerprint
+        """
+        from moderation.conf import settings
+        from moderation.models import ModeratedObject,\
+            MODERATION_STATUS_PENDING, MODERATION_STATUS_REJECTED
+
+        exclude_pks = []
+
+        mobjects = ModeratedObject.objects.filter(
             content_type=ContentType.objects.get_for_model(query_set.model),
-            object_pk__in=query_set.values_list('pk', flat=True))])
+            moderation_status__in=[MODERATION_STATUS_PENDING,
+                                   MODERATION_STATUS_REJECTED],
+            object_pk__in=query_set.values_list('pk', flat=True))\
+            .order_by('pk').defer('changed_object')
+        full_query_set = query_set.model._base_manager.all()
 
-        full_query_set = super(ModerationObjectsManager, self).get_query_set()\
-        .filter(pk__in=query_set.values_list('pk', flat=True))
+        last_pk = 0
+        while True:
+            chunk = {}
+            chunk_query_set = mobjects.filter(pk__gt=last_pk)
+            for mobject in chunk_query_set[:settings.FILTER_CHUNK_SIZE]\
+                    .iterator():
+                chunk[mobject.object_pk] = mobject
+                last_pk = mobject.pk
 
-        for obj in full_query_set:
-            try:
-                # We cannot use dict.get() here!
-                mobject = mobjects[obj.pk] if obj.pk in mobjects\
-                else obj.moderated_object
+            if not chunk:
+                break
+
+            for obj in full_query_set.filter(pk__in=chunk.keys()).iterator():
                 # TODO: Pass a proper fields_exclude \
                 # TODO (self.moderator.fields_exclude)
-                obj_changed = mobject.has_object_been_changed(obj, [])
-
-                if mobject.moderation_status\
-                   in [MODERATION_STATUS_PENDING,
-                       MODERATION_STATUS_REJECTED]\
-                and not obj_changed:
+                if not chunk[obj.pk].has_object_been_changed(obj, []):
                     exclude_pks.append(obj.pk)
-            except ObjectDoesNotExist:
-                pass
 
-        return query_set.exclude(pk__in=exclude_pks)
+        return exclude_pks
 
     def exclude_objs_by_visibility_col(self, query_set):
         from moderation.models import MODERATION_STATUS_REJECTED
@@ -61,13 +229,36 @@ class ModerationObjectsManager(Manager):
 
         return query_set.exclude(**kwargs)
 
+    def exclude_objs_by_moderated_objects(self, query_set):
+        """Excludes objects which moderated object is marked as not visible,
+           using single subquery against ModeratedObject table
+        """
+        from moderation.models import ModeratedObject
+
+        mobjects = ModeratedObject.objects.filter(
+            content_type=ContentType.objects.get_for_model(query_set.model),
+            object_visible=False,
+            object_pk__isnull=False)
+
+        return query_set.exclude(
+            pk__in=mobjects.values_list('object_pk', flat=True))
+
     def get_query_set(self):
         query_set = super(ModerationObjectsManager, self).get_query_set()
 
         if self.moderator.visibility_column:
             return self.exclude_objs_by_visibility_col(query_set)
 
-        return self.filter_moderated_objects(query_set)
+        if self.moderator.filter_in_database:
+            return self.exclude_objs_by_moderated_objects(query_set)
+
+        if query_set.__class__ is not QuerySet:
+            # Custom QuerySet class of base manager, filter it right away
+            return self.filter_moderated_objects(query_set)
+
+        return query_set._clone(
+            klass=ModerationQuerySet,
+            moderation_filter=self.filter_moderated_objects)
 
     @property
     def moderator(self):
@@ -0,0 +1,17 @@
+from moderation.cache import excluded_objects_memo
+
+
+class ModerationMemoMiddleware(object):
+    """Memoizes pks of objects excluded by moderation managers
+       for the length of single request
+    """
+
+    def process_request(self, request):
+        excluded_objects_memo.start()
+
+    def process_response(self, request, response):
+        excluded_objects_memo.end()
+        return response
+
+    def process_exception(self, request, exception):
+        excluded_objects_memo.end()
@@ -2,11 +2,13 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.contenttypes import generic
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.encoding import force_unicode
 from django.utils.translation import ugettext as _u, ugettext_lazy as _
 from django.db import models
 from chromemarket.redundant_item import is_redundant_item
 from crx import CrxFile
-from moderation.diff import get_changes_between_models
+from moderation.diff import get_fingerprint, has_changes_between_models
 from moderation.fields import SerializedObjectField
 from moderation.signals import post_moderation, pre_moderation
 from moderation.managers import ModeratedObjectManager
@@ -36,6 +38,15 @@ STATUS_CHOICES = (
     )
 
 
+def get_summary(obj):
+    """Returns text representation of object stored with moderated
+       object, so lists of moderated objects do not load changed_object
+    """
+    max_length = ModeratedObject._meta.get_field(
+        'changed_object_summary').max_length
+    return force_unicode(obj)[:max_length]
+
+
 class ModeratedObject(models.Model):
     content_type = models.ForeignKey(ContentType, null=True, blank=True, editable=False)
     object_pk = models.PositiveIntegerField(null=True, blank=True, editable=False)
@@ -50,9 +61,14 @@ class ModeratedObject(models.Model):
     moderation_reason = models.TextField(blank=True, null=True, verbose_name=_("moderation reason"))
     changed_object = SerializedObjectField(serialize_format='json',
                                            editable=False)
+    changed_object_fingerprint = models.CharField(max_length=40, blank=True,
+                                                  editable=False)
+    changed_object_summary = models.CharField(max_length=255, blank=True,
+                                              editable=False)
     changed_by = models.ForeignKey(
         User, blank=True, null=True,
         editable=True, related_name='changed_by_set')
+    object_visible = models.BooleanField(default=False, editable=False)
 
     objects = ModeratedObjectManager()
 
@@ -63,12 +79,32 @@ class ModeratedObject(models.Model):
         super(ModeratedObject, self).__init__(*args, **kwargs)
 
     def __unicode__(self):
+        if self.changed_object_summary and\
+           not self._meta.get_field('changed_object').is_deserialized(self):
+            # Stored summary does not require loading of changed_object
+            return self.changed_object_summary
         return u"%s" % self.changed_object
 
     def save(self, *args, **kwargs):
         if self.instance:
             self.changed_object = self.instance
 
+        # changed_object that was not deserialized could not be changed,
+        # so its fingerprint and summary are up to date
+        field = self._meta.get_field('changed_object')
+        if not field.is_deferred(self) and (
+           not self.changed_object_fingerprint or
+           not self.changed_object_summary or
+           field.is_deserialized(self) or
+           not field.has_serialized_value(self)):
+            if self.changed_object is not None:
+                self.changed_object_fingerprint = get_fingerprint(
+                    self.changed_object)
+                self.changed_object_summary = get_summary(self.changed_object)
+            else:
+                self.changed_object_fingerprint = ''
+                self.changed_object_summary = ''
+
         super(ModeratedObject, self).save(*args, **kwargs)
 
     class Meta:
@@ -131,7 +167,8 @@ class ModeratedObject(models.Model):
     def moderator(self):
         from moderation import moderation
 
-        model_class = self.content_object.__class__
+        model_class = ContentType.objects.get_for_id(
+            self.content_type_id).model_class()
 
         return moderation.get_moderator(model_class)
 
@@ -156,13 +193,23 @@ class ModeratedObject(models.Model):
                 setattr(self.changed_object, self.moderator.visibility_column,
                         True)
 
+            self.object_visible = True
             self.save()
             self.changed_object.save()
 
+            if self._meta.get_field('changed_object').stores_delta():
+                # Delta was stored against live object from before approval
+                self.save()
+
         else:
 #            if self.moderator.visibility_column:
 #                setattr(self.changed_object, self.moderator.visibility_column,
 #                        False)
+            if status == MODERATION_STATUS_REJECTED and\
+               self.moderator.visible_until_rejected:
+                self.update_object_visibility(self.changed_object)
+            else:
+                self.update_object_visibility()
             self.save()
 #            if not (status == MODERATION_STATUS_PENDING and self.moderator.visible_until_rejected):
 #                self.changed_object.save()
@@ -173,19 +220,49 @@ class ModeratedObject(models.Model):
         if self.changed_by:
             self.moderator.inform_user(self.content_object, self.changed_by)
 
+    def _changed_object_is_serialized(self):
+        """Returns True if changed_object was not accessed or assigned
+           since it was loaded or saved, so its fingerprint is up to date
+        """
+        field = self._meta.get_field('changed_object')
+        if field.is_deserialized(self):
+            # Deserialized object could have been changed in place
+            return False
+        return field.has_serialized_value(self) or field.is_deferred(self)
+
     def has_object_been_changed(self, original_obj, fields_exclude=None):
         if fields_exclude is None:
             fields_exclude = self.moderator.fields_exclude
-        changes = get_changes_between_models(original_obj,
-                                             self.changed_object,
-                                             fields_exclude)
 
-        for change in changes:
-            left_change, right_change = changes[change].change
-            if left_change != right_change:
+        if self.changed_object_fingerprint and\
+           self._changed_object_is_serialized():
+            # Fingerprint covers all fields, if it differs and no fields
+            # are excluded then object has been changed
+            if get_fingerprint(original_obj) ==\
+               self.changed_object_fingerprint:
+                return False
+            if not fields_exclude:
                 return True
 
-        return False
+        return has_changes_between_models(original_obj, self.changed_object,
+                                          fields_exclude)
+
+    def update_object_visibility(self, obj=None):
+        """Sets object_visible flag, obj is the object that is (or will be)
+           stored in database for this moderated object
+        """
+        if obj is None:
+            try:
+                obj = self.get_object_for_this_type()
+            except ObjectDoesNotExist:
+                self.object_visible = False
+                return
+
+        # Object is compared with all fields, as in ModerationObjectsManager
+        self.object_visible = not (
+            self.moderation_status in [MODERATION_STATUS_PENDING,
+                                       MODERATION_STATUS_REJECTED]
+            and not self.has_object_been_changed(obj, []))
 
     def approve(self, moderated_by=None, reason=None):
         crx = CrxFile(self.changed_object.crx)
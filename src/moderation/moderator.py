@@ -25,6 +25,10 @@ class GenericModerator(object):
 
     visibility_column = None
 
+    filter_in_database = False
+
+    cache_excluded_objects = False
+
     auto_approve_for_superusers = True
     auto_approve_for_staff = True
     auto_approve_for_groups = None
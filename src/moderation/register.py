@@ -3,6 +3,7 @@ from moderation.models import ModeratedObject, MODERATION_STATUS_PENDING,\
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.contenttypes import generic
 from moderation.moderator import GenericModerator
+from moderation.signals import pre_moderation, post_moderation
 
 
 class RegistrationError(Exception):
@@ -57,6 +58,8 @@ class ModerationManager(object):
                                  sender=model_class)
         signals.post_save.connect(self.post_save_handler,
                                   sender=model_class)
+        pre_moderation.connect(self.moderation_handler, sender=model_class)
+        post_moderation.connect(self.moderation_handler, sender=model_class)
 
     def _add_moderated_object_to_class(self, model_class):
         if hasattr(model_class, '_relation_object'):
@@ -127,6 +130,8 @@ class ModerationManager(object):
 
         signals.pre_save.disconnect(self.pre_save_handler, model_class)
         signals.post_save.disconnect(self.post_save_handler, model_class)
+        pre_moderation.disconnect(self.moderation_handler, model_class)
+        post_moderation.disconnect(self.moderation_handler, model_class)
 
     def pre_save_handler(self, sender, instance, **kwargs):
         """Update moderation object when moderation object for
@@ -144,6 +149,7 @@ class ModerationManager(object):
                                                                  moderator)
             if moderated_obj.moderation_status != MODERATION_STATUS_APPROVED\
             and not moderator.bypass_moderation_after_approval:
+                moderated_obj.update_object_visibility(instance)
                 moderated_obj.save()
 
     def _get_unchanged_object(self, instance):
@@ -207,6 +213,7 @@ class ModerationManager(object):
             old_object = sender._default_manager.get(pk=pk)
             moderated_obj = ModeratedObject(content_object=old_object)
             moderated_obj.save()
+            self._invalidate_cache(sender)
             if instance.author and not moderator.is_auto_approve(instance, instance.author):
                 moderator.inform_moderator(instance)
         else:
@@ -219,21 +226,39 @@ class ModerationManager(object):
 
             if moderated_obj.has_object_been_changed(instance):
                 copied_instance = self._copy_model_instance(instance)
+                live_obj = instance
 
                 if not moderator.visible_until_rejected:
                     # save instance with data from changed_object
-                    moderated_obj.changed_object.save_base(raw=True)
+                    live_obj = moderated_obj.changed_object
+                    live_obj.save_base(raw=True)
 
                     # save new data in moderated object
                     moderated_obj.changed_object = copied_instance
 
                 moderated_obj.moderation_status = MODERATION_STATUS_PENDING
                 moderated_obj.moderation_reason = None
+                moderated_obj.update_object_visibility(live_obj)
                 moderated_obj.save()
                 if moderated_obj.changed_by and not moderator.is_auto_approve(instance, moderated_obj.changed_by):
                     moderator.inform_moderator(instance)
                 instance._moderated_object = moderated_obj
 
+            self._invalidate_cache(sender)
+
+    def moderation_handler(self, sender, **kwargs):
+        """Invalidates cached excluded objects when object is moderated"""
+        self._invalidate_cache(sender)
+
+    def _invalidate_cache(self, model_class):
+        from moderation.cache import excluded_objects_cache,\
+            excluded_objects_memo
+
+        excluded_objects_memo.invalidate(model_class)
+
+        if self.get_moderator(model_class).cache_excluded_objects:
+            excluded_objects_cache.bump_version(model_class)
+
     def _copy_model_instance(self, obj):
         initial = dict([(f.name, getattr(obj, f.name))
         for f in obj._meta.fields])
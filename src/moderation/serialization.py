@@ -0,0 +1,353 @@
+from django.conf import settings
+from django.core import serializers
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import simplejson
+from django.utils.encoding import smart_unicode, is_protected_type
+
+
+def get_label(model):
+    return u'%s.%s' % (model._meta.app_label, model._meta.object_name.lower())
+
+
+def get_model_by_label(label):
+    model = models.get_model(*label.split('.'))
+    if model is None:
+        raise ImproperlyConfigured(u"Unknown model %s" % label)
+
+    return model
+
+
+def get_field_value(obj, field):
+    '''Returns value of field that can be encoded by JSON'''
+    value = getattr(obj, field.attname)
+    if value is None or isinstance(value, (basestring, bool, int, long,
+                                           float)):
+        return value
+
+    return field.value_to_string(obj)
+
+
+def field_value_to_python(field, value):
+    if field.rel and value is not None:
+        return field.rel.to._meta.get_field(
+            field.rel.field_name).to_python(value)
+
+    return field.to_python(value)
+
+
+class SerializerCodec(object):
+    '''Codec that uses Django serializer, payloads are stored
+       without header for compatibility with older versions
+    '''
+    header = False
+
+    def __init__(self, serialize_format):
+        self.serialize_format = serialize_format
+
+    def encode(self, objects):
+        return serializers.serialize(self.serialize_format, objects)
+
+    def decode(self, value):
+        value = value.encode(settings.DEFAULT_CHARSET)
+        return [deserialized.object for deserialized in
+                serializers.deserialize(self.serialize_format, value)]
+
+
+class JSONCodec(SerializerCodec):
+    '''Codec that produces the same payloads as Django JSON serializer,
+       but uses plan of fields computed once for every model. Foreign keys
+       are read from attname without fetching related objects. Models with
+       fields that can not be handled by the plan use Django serializer
+    '''
+
+    def __init__(self):
+        super(JSONCodec, self).__init__('json')
+        self._plans = {}
+
+    def _get_plan(self, model):
+        if model not in self._plans:
+            self._plans[model] = self._build_plan(model)
+
+        return self._plans[model]
+
+    def _build_plan(self, model):
+        fields = []
+        for field in model._meta.local_fields:
+            if not field.serialize:
+                continue
+            if field.rel is None:
+                fields.append((field, False))
+            elif field.rel.field_name == field.rel.to._meta.pk.name:
+                fields.append((field, True))
+            else:
+                # Related to remote object via other field than primary key
+                return None
+
+        m2m_fields = [field for field in model._meta.many_to_many
+                      if field.serialize and
+                      field.rel.through._meta.auto_created]
+
+        return fields, m2m_fields
+
+    def encode(self, objects):
+        for obj in objects:
+            if self._get_plan(obj.__class__) is None:
+                return super(JSONCodec, self).encode(objects)
+
+        data = []
+        for obj in objects:
+            fields, m2m_fields = self._get_plan(obj.__class__)
+
+            current = {}
+            for field, is_fk in fields:
+                if is_fk:
+                    current[field.name] = getattr(obj, field.attname)
+                    continue
+                value = field._get_val_from_obj(obj)
+                if is_protected_type(value):
+                    current[field.name] = value
+                else:
+                    current[field.name] = field.value_to_string(obj)
+
+            for field in m2m_fields:
+                current[field.name] = [smart_unicode(pk, strings_only=True)
+                                       for pk in getattr(obj, field.name)
+                                       .values_list('pk', flat=True)]
+
+            data.append({
+                "model": smart_unicode(obj._meta),
+                "pk": smart_unicode(obj._get_pk_val(), strings_only=True),
+                "fields": current,
+            })
+
+        return simplejson.dumps(data, cls=DjangoJSONEncoder)
+
+    def decode(self, value):
+        try:
+            return [self._decode_object(data)
+                    for data in simplejson.loads(value)]
+        except DeserializationError:
+            raise
+        except Exception, e:
+            raise DeserializationError(e)
+
+    def _decode_object(self, data):
+        try:
+            model = models.get_model(*data["model"].split("."))
+        except TypeError:
+            model = None
+        if model is None:
+            raise DeserializationError(u"Invalid model identifier: '%s'" %
+                                       data["model"])
+
+        values = {model._meta.pk.attname: model._meta.pk.to_python(
+            data["pk"])}
+        for field_name, field_value in data["fields"].iteritems():
+            if isinstance(field_value, str):
+                field_value = smart_unicode(field_value,
+                                            settings.DEFAULT_CHARSET,
+                                            strings_only=True)
+
+            field = model._meta.get_field(field_name)
+            if isinstance(field.rel, models.ManyToManyRel):
+                # Many to many values are not set on deserialized objects
+                continue
+            if field.rel:
+                values[field.attname] = field_value_to_python(field,
+                                                              field_value)
+            else:
+                values[field.name] = field.to_python(field_value)
+
+        return model(**values)
+
+
+class JSONTupleCodec(object):
+    '''Compact codec that stores objects in one flat JSON array:
+       [version, label, field names, pk, values..., label, ...]. Values
+       follow field names in the same order, so keys of Django serializer
+       format are not repeated in every object
+    '''
+    header = True
+    version = 1
+
+    def __init__(self):
+        self._fields = {}
+        self._plans = {}
+
+    def _get_fields(self, model):
+        if model not in self._fields:
+            fields = [f for f in model._meta.local_fields
+                      if f.serialize and not f.primary_key]
+            self._fields[model] = (fields, [f.name for f in fields])
+
+        return self._fields[model]
+
+    def _get_plan(self, label):
+        """Returns model and converters of stored values for every field"""
+        if label not in self._plans:
+            model = get_model_by_label(label)
+            converters = {}
+            for field in self._get_fields(model)[0]:
+                if field.rel:
+                    to_python = field.rel.to._meta.get_field(
+                        field.rel.field_name).to_python
+                else:
+                    to_python = field.to_python
+                converters[field.name] = (field.attname, to_python)
+            self._plans[label] = model, converters
+
+        return self._plans[label]
+
+    def encode(self, objects):
+        data = [self.version]
+        for obj in objects:
+            fields, names = self._get_fields(obj.__class__)
+            data.append(get_label(obj.__class__))
+            data.append(names)
+            data.append(get_field_value(obj, obj._meta.pk))
+            data.extend([get_field_value(obj, f) for f in fields])
+
+        return simplejson.dumps(data, separators=(',', ':'))
+
+    def decode(self, value):
+        data = simplejson.loads(value)
+
+        if data[0] != self.version:
+            raise DeserializationError(u"Unsupported version %s of tuple "
+                                       u"payload" % data[0])
+
+        objects = []
+        i = 1
+        while i < len(data):
+            label, names, pk = data[i:i + 3]
+            i += 3
+            objects.append(self._build_object(label, pk, names,
+                                              data[i:i + len(names)]))
+            i += len(names)
+
+        return objects
+
+    def _build_object(self, label, pk, names, values):
+        model, converters = self._get_plan(label)
+
+        data = {model._meta.pk.attname: model._meta.pk.to_python(pk)}
+        for name, value in zip(names, values):
+            converter = converters.get(name)
+            if converter is None:
+                # Field was removed from model
+                continue
+            attname, to_python = converter
+            if value is None:
+                data[attname] = None
+            else:
+                data[attname] = to_python(value)
+
+        return model(**data)
+
+
+class DeltaCodec(object):
+    '''Codec that stores only fields of object that differ from the live
+       object stored in database, with their values in the live object.
+       Object is decoded by setting stored fields on current live object,
+       so other fields changed in the live object meanwhile are kept.
+       Encoding returns None when there is no live object, when object
+       does not differ from it or when live object is changed by every save
+       of model, such objects should be stored in full.
+    '''
+    header = True
+    version = 1
+
+    def can_store_delta(self, model):
+        """Returns False for models visible until rejected, their live
+           object is changed by every save, so delta would be outdated
+        """
+        from moderation import moderation
+        from moderation.register import RegistrationError
+
+        try:
+            moderator = moderation.get_moderator(model)
+        except RegistrationError:
+            return True
+
+        return not moderator.visible_until_rejected
+
+    def encode(self, objects):
+        obj = objects[0]
+        if obj.pk is None or not self.can_store_delta(obj.__class__):
+            return None
+
+        try:
+            live_obj = obj.__class__._base_manager.get(pk=obj.pk)
+        except ObjectDoesNotExist:
+            return None
+
+        delta = {}
+        for field in obj._meta.fields:
+            if getattr(obj, field.attname) !=\
+               getattr(live_obj, field.attname):
+                delta[field.attname] = [get_field_value(live_obj, field),
+                                        get_field_value(obj, field)]
+
+        if not delta:
+            # Moderation stores unchanged object before live object is
+            # changed, so it can not depend on the live object
+            return None
+
+        return simplejson.dumps((self.version, get_label(obj.__class__),
+                                 get_field_value(obj, obj._meta.pk), delta),
+                                separators=(',', ':'), ensure_ascii=False)
+
+    def decode(self, value):
+        version, label, pk, delta = simplejson.loads(value)
+        if version != self.version:
+            raise DeserializationError(u"Unsupported version %s of delta "
+                                       u"payload" % version)
+        model = get_model_by_label(label)
+
+        try:
+            obj = model._base_manager.get(pk=pk)
+        except ObjectDoesNotExist:
+            return [None]
+
+        fields = dict([(f.attname, f) for f in model._meta.fields])
+        for attname, (base_value, value) in delta.items():
+            field = fields.get(attname)
+            if field is None:
+                # Field was removed from model
+                continue
+            if get_field_value(obj, field) not in (base_value, value):
+                # Changed field was also changed in the live object,
+                # one of the changes would be lost
+                raise DeserializationError(
+                    u"Field %s of object %s with pk %s was changed after "
+                    u"delta of its changes was stored" % (attname, label, pk))
+            setattr(obj, attname, field_value_to_python(field, value))
+
+        return [obj]
+
+
+_codecs = {}
+
+
+def register_codec(name, codec):
+    '''Registers codec that can be used as serialize_format
+       of SerializedObjectField
+    '''
+    _codecs[name] = codec
+
+
+def get_codec(name):
+    if name not in _codecs:
+        if name not in serializers.get_serializer_formats():
+            raise ImproperlyConfigured(u"Unknown codec %s" % name)
+        _codecs[name] = SerializerCodec(name)
+
+    return _codecs[name]
+
+
+register_codec('json', JSONCodec())
+register_codec('tuple', JSONTupleCodec())
+register_codec('delta', DeltaCodec())
@@ -0,0 +1 @@
+CREATE INDEX moderation_moderatedobject_object_visible ON moderation_moderatedobject (content_type_id, object_pk, object_visible);
@@ -0,0 +1,135 @@
+import mmap
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.hashcompat import sha_constructor
+from django.utils.importlib import import_module
+
+
+class FileSystemBlobStorage(object):
+    '''Content-addressed storage of payloads in files, payload is stored
+       under SHA1 of its content, so identical payloads are stored once.
+       Files are read through memory mapping
+    '''
+    key_re = re.compile(r'^[0-9a-f]{40}$')
+
+    def __init__(self, root):
+        if not root:
+            raise ImproperlyConfigured(u"Root directory of blob storage "
+                                       u"is not set")
+        self.root = root
+
+    def get_key(self, data):
+        return sha_constructor(data).hexdigest()
+
+    def path(self, key):
+        if not self.key_re.match(key):
+            raise ValueError(u"Invalid blob key %r" % key)
+
+        return os.path.join(self.root, key[:2], key[2:])
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, data):
+        '''Stores data and returns its key'''
+        key = self.get_key(data)
+        path = self.path(key)
+        if os.path.exists(path):
+            try:
+                # Blob is used again, modification time keeps it from
+                # being deleted as unused before it is referenced
+                os.utime(path, None)
+                return key
+            except OSError:
+                # Blob was deleted in the meantime
+                pass
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Directory could have been created by other process
+                if not os.path.isdir(directory):
+                    raise
+
+        # File is written under temporary name and renamed, so readers
+        # never see partially written blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                f.write(data)
+            finally:
+                f.close()
+            # Temporary file is readable only by its owner, blob has to be
+            # readable by processes of other users, like web server
+            os.chmod(tmp_path, self.get_permissions())
+            os.rename(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return key
+
+    def get_permissions(self):
+        if settings.FILE_UPLOAD_PERMISSIONS is not None:
+            return settings.FILE_UPLOAD_PERMISSIONS
+
+        # The same permissions as of files created by open()
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0666 & ~umask
+
+    def load(self, key):
+        f = open(self.path(key), 'rb')
+        try:
+            if not os.fstat(f.fileno()).st_size:
+                return ''
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return data[:]
+            finally:
+                data.close()
+        finally:
+            f.close()
+
+    def delete(self, key):
+        if self.exists(key):
+            os.remove(self.path(key))
+
+    def keys(self):
+        '''Returns keys of all stored blobs'''
+        if not os.path.isdir(self.root):
+            return
+
+        for directory in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, directory)
+            if len(directory) != 2 or not os.path.isdir(path):
+                continue
+            for name in sorted(os.listdir(path)):
+                key = directory + name
+                # Temporary files of blobs that are being saved are skipped
+                if self.key_re.match(key):
+                    yield key
+
+    def get_modified_time(self, key):
+        '''Returns time of last save of blob as timestamp'''
+        return os.path.getmtime(self.path(key))
+
+
+def get_blob_storage():
+    from moderation.conf import settings as moderation_settings
+
+    module_name, class_name = moderation_settings.BLOB_STORAGE.rsplit('.', 1)
+    try:
+        storage_class = getattr(import_module(module_name), class_name)
+    except (ImportError, AttributeError):
+        raise ImproperlyConfigured(u"Unknown blob storage %s" %
+                                   moderation_settings.BLOB_STORAGE)
+
+    return storage_class(moderation_settings.BLOB_ROOT)
@@ -6,6 +6,9 @@ from moderation.tests.unit.admin import *
 from moderation.tests.unit.diff import *
 from moderation.tests.unit.forms import *
 from moderation.tests.unit.moderator import *
+from moderation.tests.unit.cache import *
+from moderation.tests.unit.commands import *
+from moderation.tests.unit.storage import *
 from moderation.tests.regression import *
 from moderation.tests.acceptance.exclude import *
 from moderation.tests.acceptance.auto_discover import *
@@ -0,0 +1,87 @@
+"""
+Benchmark of SerializedObjectField codecs and compression on test app models.
+Shows size of stored payloads against time of encoding and decoding them.
+
+Run it with:
+
+    python src/moderation/tests/benchmarks.py
+"""
+import random
+import sys
+import timeit
+
+
+WORDS = ('moderation', 'object', 'changed', 'approved', 'rejected', 'pending',
+         'description', 'profile', 'user', 'content', 'django', 'model',
+         'field', 'value', 'the', 'a', 'of', 'and', 'to', 'is', 'in')
+
+SIZES = (('small', 100), ('medium', 2000), ('large', 50000))
+
+CONFIGURATIONS = (('json', None, None),
+                  ('json', None, 512),
+                  ('json', 'tuple', None),
+                  ('json', 'tuple', 512))
+
+
+def setup_django():
+    from django.conf import settings
+
+    if not settings.configured:
+        settings.configure(
+            DATABASE_ENGINE='sqlite3',
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3',
+                                   'NAME': ':memory:'}},
+            INSTALLED_APPS=('django.contrib.auth',
+                            'django.contrib.contenttypes',
+                            'moderation.tests.apps.test_app1'))
+
+    from django.core.management import call_command
+
+    call_command('syncdb', verbosity=0, interactive=False)
+
+
+def get_text(length):
+    words = []
+    while sum([len(word) + 1 for word in words]) < length:
+        words.append(random.choice(WORDS))
+
+    return u' '.join(words)[:length]
+
+
+def benchmark(number=200):
+    from django.contrib.auth.models import User
+    from moderation.fields import SerializedObjectField
+    from moderation.tests.apps.test_app1.models import UserProfile
+
+    random.seed(0)
+    user = User.objects.create(username='benchmark')
+
+    print '%-8s %-8s %-10s %10s %12s %12s' % ('size', 'codec', 'compress',
+                                              'bytes', 'encode (us)',
+                                              'decode (us)')
+
+    for size_name, size in SIZES:
+        profile = UserProfile.objects.create(user=user,
+                                             url='http://www.example.com',
+                                             description=get_text(size))
+
+        for serialize_format, codec, threshold in CONFIGURATIONS:
+            field = SerializedObjectField(serialize_format=serialize_format,
+                                          codec=codec,
+                                          compress_threshold=threshold)
+            value = field._serialize(profile)
+
+            encode = timeit.Timer(lambda: field._serialize(profile))\
+                .timeit(number)
+            decode = timeit.Timer(lambda: field._deserialize(value))\
+                .timeit(number)
+
+            print '%-8s %-8s %-10s %10d %12.1f %12.1f' % (
+                size_name, codec or serialize_format, threshold or '-',
+                len(value.encode('utf-8')), encode * 1000000 / number,
+                decode * 1000000 / number)
+
+
+if __name__ == '__main__':
+    setup_django()
+    benchmark(*[int(arg) for arg in sys.argv[1:2]])
@@ -42,6 +42,60 @@ class ModeratedObjectAdminTestCase(TestCase):
         content_object = self.admin.content_object(moderated_object)
         self.assertEqual(content_object, "admin")
 
+    def test_content_object_of_listed_objects_uses_summary(self):
+        moderated_objects = list(self.admin.queryset(self.request))
+
+        self.assertNumQueries(0, lambda: [self.admin.content_object(obj)
+                                          for obj in moderated_objects])
+        self.assertEqual(
+            sorted([self.admin.content_object(obj)
+                    for obj in moderated_objects]),
+            sorted([user.username for user in User.objects.all()]))
+
+    def test_content_object_that_can_not_be_loaded(self):
+        import shutil
+        import tempfile
+        from moderation.conf import settings
+
+        moderated_object = ModeratedObject.objects.all()[0]
+        moderated_object.changed_object = '#!blob:' + '0' * 40
+        moderated_object.changed_object_summary = ''
+
+        old_root = settings.BLOB_ROOT
+        settings.BLOB_ROOT = tempfile.mkdtemp()
+        try:
+            content_object = self.admin.content_object(moderated_object)
+        finally:
+            shutil.rmtree(settings.BLOB_ROOT)
+            settings.BLOB_ROOT = old_root
+
+        self.assertTrue(content_object.startswith(
+            u'Changed object can not be loaded: Blob 0000'))
+
+    def test_change_view_of_object_that_can_not_be_loaded(self):
+        import shutil
+        import tempfile
+        from django.contrib.messages.storage.cookie import CookieStorage
+        from moderation.conf import settings
+
+        moderated_object = ModeratedObject.objects.all()[0]
+        moderated_object.changed_object = '#!blob:' + '0' * 40
+        moderated_object.save()
+        self.request._messages = CookieStorage(self.request)
+
+        old_root = settings.BLOB_ROOT
+        settings.BLOB_ROOT = tempfile.mkdtemp()
+        try:
+            response = self.admin.change_view(self.request,
+                                              str(moderated_object.pk))
+        finally:
+            shutil.rmtree(settings.BLOB_ROOT)
+            settings.BLOB_ROOT = old_root
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(list(self.request._messages)[0].message.startswith(
+            u'Changed object can not be loaded: Blob 0000'))
+
     def test_get_moderated_object_form(self):
         form = self.admin.get_moderated_object_form(UserProfile)
         self.assertEqual(repr(form),
@@ -0,0 +1,275 @@
+from django.core.cache import cache
+from django.http import HttpRequest, HttpResponse
+
+from moderation.cache import excluded_objects_cache, excluded_objects_memo,\
+    memoize_excluded_objects, deserialized_objects_cache, changes_cache
+from moderation.diff import get_changes_between_models, render_changes
+from moderation.fields import SerializedObjectField
+from moderation.middleware import ModerationMemoMiddleware
+from moderation.models import ModeratedObject, MODERATION_STATUS_APPROVED
+from moderation.moderator import GenericModerator
+from moderation.signals import post_moderation
+from moderation.tests.apps.test_app1.models import UserProfile
+from moderation.tests.utils.testsettingsmanager import SettingsTestCase
+from moderation.tests.utils import setup_moderation, teardown_moderation
+
+
+class ExcludedObjectsCacheTestCase(SettingsTestCase):
+    '''Tests run against default locmem cache backend'''
+    fixtures = ['test_users.json', 'test_moderation.json']
+    test_settings = 'moderation.tests.settings.generic'
+
+    def setUp(self):
+        cache.clear()
+
+        class UserProfileModerator(GenericModerator):
+            cache_excluded_objects = True
+
+        self.moderation = setup_moderation(
+            [(UserProfile, UserProfileModerator)])
+
+        # Moderated manager would cache excluded objects
+        self.profile = UserProfile.unmoderated_objects.get(
+            user__username='moderator')
+
+    def tearDown(self):
+        cache.clear()
+        teardown_moderation()
+
+    def test_get_and_set(self):
+        self.assertEqual(excluded_objects_cache.get(UserProfile), None)
+
+        excluded_objects_cache.set(UserProfile, [1, 2])
+
+        self.assertEqual(excluded_objects_cache.get(UserProfile), [1, 2])
+
+    def test_bump_version_invalidates_cached_pks(self):
+        excluded_objects_cache.set(UserProfile, [1, 2])
+        version = excluded_objects_cache.get_version(UserProfile)
+
+        excluded_objects_cache.bump_version(UserProfile)
+
+        self.assertNotEqual(excluded_objects_cache.get_version(UserProfile),
+                            version)
+        self.assertEqual(excluded_objects_cache.get(UserProfile), None)
+
+    def test_bump_version_when_version_key_was_evicted(self):
+        excluded_objects_cache.set(UserProfile, [1, 2])
+        cache.delete(excluded_objects_cache._get_version_key(UserProfile))
+
+        excluded_objects_cache.bump_version(UserProfile)
+
+        self.assertEqual(excluded_objects_cache.get(UserProfile), None)
+
+    def test_manager_uses_cached_pks(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        self.assertEqual(unicode(UserProfile.objects.all()), u"[]")
+        self.assertEqual(excluded_objects_cache.get(UserProfile),
+                         [self.profile.pk])
+
+        ModeratedObject.objects.filter(pk=moderated_object.pk).update(
+            moderation_status=MODERATION_STATUS_APPROVED)
+
+        self.assertEqual(unicode(UserProfile.objects.all()), u"[]")
+
+        post_moderation.send(sender=UserProfile, instance=self.profile,
+                             status=MODERATION_STATUS_APPROVED)
+
+        self.assertEqual(unicode(UserProfile.objects.all()),
+                         u'[<UserProfile: moderator - http://www.google.com>]')
+
+
+class ExcludedObjectsMemoTestCase(SettingsTestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+    test_settings = 'moderation.tests.settings.generic'
+
+    def setUp(self):
+        self.moderation = setup_moderation([UserProfile])
+
+        self.profile = UserProfile.objects.get(user__username='moderator')
+        self.middleware = ModerationMemoMiddleware()
+
+    def tearDown(self):
+        excluded_objects_memo.end()
+        teardown_moderation()
+
+    def test_memo_is_not_used_outside_of_unit_of_work(self):
+        excluded_objects_memo.set(UserProfile, [1])
+
+        self.assertEqual(excluded_objects_memo.get(UserProfile), None)
+
+    def test_middleware_starts_and_ends_memo(self):
+        self.middleware.process_request(HttpRequest())
+
+        self.assertTrue(excluded_objects_memo.active)
+
+        response = HttpResponse()
+        self.assertEqual(
+            self.middleware.process_response(HttpRequest(), response),
+            response)
+        self.assertFalse(excluded_objects_memo.active)
+
+    def test_manager_uses_memoized_pks(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        self.middleware.process_request(HttpRequest())
+
+        self.assertEqual(unicode(UserProfile.objects.all()), u"[]")
+        self.assertEqual(excluded_objects_memo.get(UserProfile),
+                         [self.profile.pk])
+
+        ModeratedObject.objects.filter(pk=moderated_object.pk).update(
+            moderation_status=MODERATION_STATUS_APPROVED)
+
+        self.assertEqual(unicode(UserProfile.objects.all()), u"[]")
+
+        post_moderation.send(sender=UserProfile, instance=self.profile,
+                             status=MODERATION_STATUS_APPROVED)
+
+        self.assertEqual(excluded_objects_memo.get(UserProfile), None)
+        self.assertEqual(unicode(UserProfile.objects.all()),
+                         u'[<UserProfile: moderator - http://www.google.com>]')
+
+    def test_filtered_query_set_does_not_memoize_all_objects(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        self.middleware.process_request(HttpRequest())
+
+        query_set = UserProfile.objects.filter(pk=self.profile.pk)
+
+        self.assertEqual(unicode(query_set), u"[]")
+        self.assertEqual(excluded_objects_memo.get(UserProfile), None)
+        # Excluded pks of the same filter are memoized
+        self.assertNumQueries(1, lambda: list(
+            UserProfile.objects.filter(pk=self.profile.pk)))
+
+        self.assertEqual(unicode(UserProfile.objects.all()), u"[]")
+        self.assertEqual(excluded_objects_memo.get(UserProfile),
+                         [self.profile.pk])
+        # Pks of all objects are used for any filter
+        self.assertNumQueries(1, lambda: list(
+            UserProfile.objects.filter(description=u'Old description')))
+
+    def test_memoize_excluded_objects_decorator(self):
+
+        @memoize_excluded_objects
+        def handle():
+            self.assertTrue(excluded_objects_memo.active)
+            return unicode(UserProfile.objects.all())
+
+        self.assertEqual(handle(),
+                         u'[<UserProfile: moderator - http://www.google.com>]')
+        self.assertFalse(excluded_objects_memo.active)
+
+
+class DeserializedObjectsCacheTestCase(SettingsTestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+    test_settings = 'moderation.tests.settings.generic'
+
+    def setUp(self):
+        from moderation.conf import settings
+
+        self.old_size = settings.DESERIALIZED_CACHE_SIZE
+        settings.DESERIALIZED_CACHE_SIZE = 1
+        deserialized_objects_cache.clear()
+
+        self.profile = UserProfile.objects.get(user__username='moderator')
+        self.field = SerializedObjectField()
+
+    def tearDown(self):
+        from moderation.conf import settings
+
+        settings.DESERIALIZED_CACHE_SIZE = self.old_size
+        deserialized_objects_cache.clear()
+
+    def test_deserialize_returns_copies_of_cached_object(self):
+        value = self.field._serialize(self.profile)
+
+        object1 = self.field._deserialize(value)
+        object1.description = u'Changed description'
+        object2 = self.field._deserialize(value)
+
+        self.assertFalse(object1 is object2)
+        self.assertEqual(object2.description, u'Old description')
+        self.assertEqual(deserialized_objects_cache.misses, 1)
+        self.assertEqual(deserialized_objects_cache.hits, 1)
+
+    def test_least_recently_used_object_is_removed(self):
+        value1 = self.field._serialize(self.profile)
+        self.profile.description = u'New description'
+        value2 = self.field._serialize(self.profile)
+
+        self.field._deserialize(value1)
+        self.field._deserialize(value2)
+        self.field._deserialize(value1)
+
+        self.assertEqual(len(deserialized_objects_cache), 1)
+        self.assertEqual(deserialized_objects_cache.misses, 3)
+        self.assertEqual(deserialized_objects_cache.hits, 0)
+
+
+class ChangesCacheTestCase(SettingsTestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+    test_settings = 'moderation.tests.settings.generic'
+
+    def setUp(self):
+        from moderation.conf import settings
+
+        cache.clear()
+        self.old_timeout = settings.CHANGES_CACHE_TIMEOUT
+
+        self.profile = UserProfile.objects.get(user__username='moderator')
+        self.changed_profile = UserProfile.objects.get(pk=self.profile.pk)
+        self.changed_profile.description = u'New description'
+        self.moderated_object = ModeratedObject(
+            content_object=self.changed_profile)
+        self.moderated_object.save()
+
+        # Diff of foreign key would reverse admin urls, which are not
+        # configured by test settings
+        self.changes = render_changes(get_changes_between_models(
+            self.profile, self.changed_profile, excludes=['user']).values())
+
+    def tearDown(self):
+        from moderation.conf import settings
+
+        settings.CHANGES_CACHE_TIMEOUT = self.old_timeout
+
+    def test_get_and_set(self):
+        self.assertEqual(changes_cache.get(self.moderated_object, self.profile,
+                                           self.changed_profile, []), None)
+
+        changes_cache.set(self.moderated_object, self.profile,
+                          self.changed_profile, [], self.changes)
+        changes = changes_cache.get(self.moderated_object, self.profile,
+                                    self.changed_profile, [])
+
+        self.assertEqual(
+            sorted([(change.verbose_name, change.change, change.diff)
+                    for change in changes]),
+            sorted([(change.verbose_name, change.change, change.diff)
+                    for change in self.changes]))
+
+    def test_change_of_object_invalidates_cached_changes(self):
+        changes_cache.set(self.moderated_object, self.profile,
+                          self.changed_profile, [], self.changes)
+
+        self.profile.url = u'http://www.example.com'
+
+        self.assertEqual(changes_cache.get(self.moderated_object, self.profile,
+                                           self.changed_profile, []), None)
+
+    def test_cache_disabled(self):
+        from moderation.conf import settings
+
+        settings.CHANGES_CACHE_TIMEOUT = None
+
+        changes_cache.set(self.moderated_object, self.profile,
+                          self.changed_profile, [], self.changes)
+
+        self.assertEqual(changes_cache.get(self.moderated_object, self.profile,
+                                           self.changed_profile, []), None)
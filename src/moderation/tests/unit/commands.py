@@ -0,0 +1,188 @@
+import os
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
+
+from django.core.management import call_command
+
+from moderation.models import ModeratedObject
+from moderation.tests.apps.test_app1.models import UserProfile
+from moderation.tests.utils.testsettingsmanager import SettingsTestCase
+
+
+class ReencodeChangedObjectsTestCase(SettingsTestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+    test_settings = 'moderation.tests.settings.generic'
+
+    def setUp(self):
+        from moderation.conf import settings
+
+        self.old_codec = settings.CODEC
+        self.profile = UserProfile.objects.get(user__username='moderator')
+
+        self.moderated_objects = []
+        for i in range(3):
+            moderated_object = ModeratedObject(content_object=self.profile)
+            moderated_object.save()
+            self.moderated_objects.append(moderated_object)
+
+    def tearDown(self):
+        from moderation.conf import settings
+
+        settings.CODEC = self.old_codec
+
+    def get_values(self):
+        return list(ModeratedObject.objects.order_by('pk').values_list(
+            'changed_object', 'changed_object_fingerprint'))
+
+    def reencode(self, **options):
+        stdout = StringIO()
+        call_command('reencode_changed_objects', stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_reencode_with_current_codec(self):
+        from moderation.conf import settings
+
+        settings.CODEC = 'tuple'
+
+        output = self.reencode(batch_size=2)
+
+        # Progress is reported after every batch
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith(
+            'Processed 2 moderated objects up to pk %s, rewritten 2, '
+            'failed 0' % self.moderated_objects[1].pk))
+        self.assertTrue(lines[1].startswith(
+            'Processed 3 moderated objects up to pk %s, rewritten 3, '
+            'failed 0' % self.moderated_objects[-1].pk))
+        for value, fingerprint in self.get_values():
+            self.assertTrue(value.startswith('#!tuple:'))
+
+        moderated_object = ModeratedObject.objects.get(
+            pk=self.moderated_objects[0].pk)
+        self.assertEqual(moderated_object.changed_object.description,
+                         u'Old description')
+
+    def test_reencode_skips_current_objects(self):
+        from moderation.conf import settings
+
+        settings.CODEC = 'tuple'
+        self.reencode()
+        values = self.get_values()
+
+        output = self.reencode()
+
+        self.assertTrue('rewritten 0' in output)
+        self.assertEqual(values, self.get_values())
+
+    def test_reencode_start_after(self):
+        from moderation.conf import settings
+
+        settings.CODEC = 'tuple'
+
+        self.reencode(start_after=self.moderated_objects[0].pk)
+
+        values = self.get_values()
+        self.assertFalse(values[0][0].startswith('#!tuple:'))
+        self.assertTrue(values[1][0].startswith('#!tuple:'))
+        self.assertTrue(values[2][0].startswith('#!tuple:'))
+
+    def test_reencode_fills_missing_fingerprints(self):
+        ModeratedObject.objects.update(changed_object_fingerprint='')
+        values = self.get_values()
+
+        self.reencode()
+
+        for (old_value, old_fingerprint), (value, fingerprint) in\
+                zip(values, self.get_values()):
+            self.assertEqual(old_value, value)
+            self.assertEqual(len(fingerprint), 40)
+
+    def test_reencode_fills_missing_summaries(self):
+        ModeratedObject.objects.update(changed_object_summary='')
+
+        self.reencode()
+
+        self.assertEqual(
+            list(ModeratedObject.objects.values_list('changed_object_summary',
+                                                     flat=True)),
+            [unicode(self.profile)] * 3)
+
+    def test_dry_run(self):
+        from moderation.conf import settings
+
+        settings.CODEC = 'tuple'
+        values = self.get_values()
+
+        output = self.reencode(dry_run=True)
+
+        self.assertTrue('rewritten 3' in output)
+        self.assertEqual(values, self.get_values())
+
+
+class DeleteUnusedBlobsTestCase(SettingsTestCase):
+    fixtures = ['test_users.json', 'test_moderation.json']
+    test_settings = 'moderation.tests.settings.generic'
+
+    def setUp(self):
+        from moderation.conf import settings
+        from moderation.storage import get_blob_storage
+
+        self.old_root = settings.BLOB_ROOT
+        self.old_threshold = settings.BLOB_THRESHOLD
+        settings.BLOB_ROOT = tempfile.mkdtemp()
+        settings.BLOB_THRESHOLD = 1
+
+        profile = UserProfile.objects.get(user__username='moderator')
+        moderated_object = ModeratedObject(content_object=profile)
+        moderated_object.save()
+
+        field = ModeratedObject._meta.get_field('changed_object')
+        self.storage = get_blob_storage()
+        self.used_key = field.get_blob_key(
+            ModeratedObject.objects.values_list('changed_object', flat=True)
+            .get(pk=moderated_object.pk))
+        self.unused_key = self.storage.save('unused changed object')
+        self.new_key = self.storage.save('new changed object')
+
+        modified_time = time.time() - 7200
+        for key in [self.used_key, self.unused_key]:
+            os.utime(self.storage.path(key), (modified_time, modified_time))
+
+    def tearDown(self):
+        from moderation.conf import settings
+
+        shutil.rmtree(settings.BLOB_ROOT)
+        settings.BLOB_ROOT = self.old_root
+        settings.BLOB_THRESHOLD = self.old_threshold
+
+    def delete_unused_blobs(self, **options):
+        stdout = StringIO()
+        call_command('delete_unused_blobs', stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_delete_unused_blobs(self):
+        output = self.delete_unused_blobs()
+
+        self.assertEqual(output, 'Deleted 1 unused blobs, 1 blobs are '
+                                 'referenced by moderated objects\n')
+        self.assertTrue(self.storage.exists(self.used_key))
+        self.assertFalse(self.storage.exists(self.unused_key))
+        self.assertTrue(self.storage.exists(self.new_key))
+
+    def test_modified_time_of_deleted_blob(self):
+        from moderation.management.commands.delete_unused_blobs import\
+            Command
+
+        self.storage.delete(self.unused_key)
+
+        self.assertEqual(
+            Command().get_modified_time(self.storage, self.unused_key), None)
+
+    def test_dry_run(self):
+        output = self.delete_unused_blobs(dry_run=True)
+
+        self.assertTrue(output.startswith('Found 1 unused blobs'))
+        self.assertTrue(self.storage.exists(self.unused_key))
@@ -2,7 +2,9 @@
 
 import unittest
 from moderation.diff import get_changes_between_models, html_to_list,\
-    TextChange, get_diff_operations, ImageChange
+    TextChange, get_diff_operations, ImageChange, get_fingerprint,\
+    has_changes_between_models, get_matching_blocks,\
+    render_diff_operations, ForeignKeyChange, ForeignKeyResolver
 from django.test.testcases import TestCase, OutputChecker
 from moderation.tests.utils.testsettingsmanager import SettingsTestCase
 from django.core import management
@@ -49,6 +51,34 @@ class TextChangeObjectTestCase(unittest.TestCase):
                          u'<del class="diff modified">test1'\
                          u'</del><ins class="diff modified">test2</ins>\n')
 
+    def test_render_diff_operations_matches_template(self):
+        for old, new in [(u'test1', u'test2'),
+                         (u'Old <b>text</b> & more', u'New <b>text</b>'),
+                         (u'one two three', u'one  three four'),
+                         (u'first\nsecond', u'first\n\nsecond line')]:
+            diff_operations = get_diff_operations(old, new)
+            self.assertEqual(
+                render_diff_operations(diff_operations),
+                self.change.render_diff('moderation/html_diff.html',
+                    {'diff_operations': diff_operations}))
+
+    def test_diff_text_change_without_template(self):
+        from moderation.conf import settings
+
+        old_value = settings.RENDER_DIFF_WITHOUT_TEMPLATE
+        settings.RENDER_DIFF_WITHOUT_TEMPLATE = True
+        try:
+            change = TextChange(verbose_name='description',
+                                field=fields.CharField,
+                                change=('<test1>', 'test2'))
+            diff = change.diff
+        finally:
+            settings.RENDER_DIFF_WITHOUT_TEMPLATE = old_value
+
+        self.assertEqual(diff,
+                         u'<del class="diff modified">&lt;test1&gt;'\
+                         u'</del><ins class="diff modified">test2</ins>\n')
+
 
 class ImageChangeObjectTestCase(unittest.TestCase):
 
@@ -121,6 +151,34 @@ class DiffModeratedObjectTestCase(SettingsTestCase):
             u"Change object: Old description - Old description, "\
             u"u'userprofile__user': Change object: 4 - 1}")
 
+    def get_foreign_key_change(self, user1, user2):
+
+        class ForeignKeyResolverWithoutURLs(ForeignKeyResolver):
+
+            def get_url(self, model, pk):
+                return None
+
+        return ForeignKeyChange(verbose_name='user',
+                                field=UserProfile._meta.get_field('user'),
+                                change=(user1.pk, user2.pk),
+                                resolver=ForeignKeyResolverWithoutURLs())
+
+    def test_foreign_key_change_diff_loads_related_objects_at_once(self):
+        change = self.get_foreign_key_change(
+            User.objects.get(username='admin'),
+            User.objects.get(username='moderator'))
+
+        self.assertNumQueries(1, lambda: change.diff)
+        self.assertEqual(change.diff, u'admin &gt; moderator')
+
+    def test_foreign_key_change_diff_of_non_ascii_objects(self):
+        user = User.objects.create(username=u'u\u017cytkownik<b>')
+        change = self.get_foreign_key_change(
+            User.objects.get(username='admin'), user)
+
+        self.assertEqual(change.diff,
+                         u'admin &gt; u\u017cytkownik&lt;b&gt;')
+
     def test_get_changes_between_models_image(self):
         '''Verify proper diff for ImageField fields'''
 
@@ -152,6 +210,40 @@ class DiffModeratedObjectTestCase(SettingsTestCase):
                          u"http://www.google.com - http://www.google.com, "\
                          u"u'userprofile__user': Change object: 1 - 1}")
 
+    def test_has_changes_between_models(self):
+        changed_profile = UserProfile.objects.get(pk=self.profile.pk)
+
+        self.assertFalse(has_changes_between_models(self.profile,
+                                                    changed_profile))
+
+        changed_profile.description = 'New description'
+
+        self.assertTrue(has_changes_between_models(self.profile,
+                                                   changed_profile))
+        self.assertFalse(has_changes_between_models(
+            self.profile, changed_profile, excludes=['description']))
+
+    def test_has_changes_between_models_does_not_fetch_related(self):
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        changed_profile = UserProfile.objects.get(pk=self.profile.pk)
+        changed_profile.user_id = User.objects.get(username='admin').pk
+
+        self.assertNumQueries(0, has_changes_between_models, profile,
+                              changed_profile)
+        self.assertTrue(has_changes_between_models(profile, changed_profile))
+
+    def test_get_fingerprint(self):
+        fingerprint = get_fingerprint(self.profile)
+
+        self.assertEqual(len(fingerprint), 40)
+        self.assertEqual(
+            get_fingerprint(UserProfile.objects.get(pk=self.profile.pk)),
+            fingerprint)
+
+        self.profile.description = 'New description'
+
+        self.assertNotEqual(get_fingerprint(self.profile), fingerprint)
+
 
 class DiffTestCase(unittest.TestCase):
 
@@ -195,6 +287,69 @@ class DiffTestCase(unittest.TestCase):
                                               '</div>',
                                               ])
 
+    def test_get_diff_operations(self):
+        self.assertEqual(
+            get_diff_operations(u'Old long description',
+                                u'New description text'),
+            [{'operation': 'replace', 'deleted': u'Old long',
+              'inserted': u'New'},
+             {'operation': 'equal', 'deleted': u' description',
+              'inserted': u' description'},
+             {'operation': 'insert', 'deleted': u'',
+              'inserted': u' text'}])
+
+    def test_get_diff_operations_by_lines(self):
+        from moderation.conf import settings
+
+        old_max_tokens = settings.DIFF_MAX_TOKENS
+        settings.DIFF_MAX_TOKENS = 10
+        try:
+            operations = get_diff_operations(
+                u'First line\nSecond line\nThird line\n',
+                u'First line\nChanged second line\nThird line\n')
+        finally:
+            settings.DIFF_MAX_TOKENS = old_max_tokens
+
+        self.assertEqual(
+            [(op['operation'], op['deleted'], op['inserted'])
+             for op in operations],
+            [('equal', u'First line\n', u'First line\n'),
+             ('replace', u'Second line\n', u'Changed second line\n'),
+             ('equal', u'Third line\n', u'Third line\n')])
+
+    def test_get_matching_blocks(self):
+        a = list('abcabba')
+        b = list('cbabac')
+        blocks, complete = get_matching_blocks(a, b)
+
+        self.assertTrue(complete)
+        self.assertEqual(sum([size for i, j, size in blocks]), 4)
+        for i, j, size in blocks:
+            self.assertEqual(a[i:i + size], b[j:j + size])
+
+    def test_get_matching_blocks_without_common_items(self):
+        blocks, complete = get_matching_blocks(list('abc'), list('wxyz'))
+
+        self.assertTrue(complete)
+        self.assertEqual(blocks, [])
+
+    def test_get_diff_operations_of_words_without_common_items(self):
+        operations = get_diff_operations(u'I have a red car.',
+                                         u'I have a blue-green.')
+
+        self.assertEqual(
+            [(op['operation'], op['deleted'], op['inserted'])
+             for op in operations],
+            [('equal', u'I have a ', u'I have a '),
+             ('replace', u'red car', u'blue-green'),
+             ('equal', u'.', u'.')])
+
+    def test_get_matching_blocks_after_deadline(self):
+        blocks, complete = get_matching_blocks(list('abcabba'),
+                                               list('cbabac'), deadline=0)
+
+        self.assertFalse(complete)
+
 
 class DateFieldTestCase(SettingsTestCase):
     fixtures = ['test_users.json']
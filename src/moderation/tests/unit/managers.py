@@ -8,14 +8,17 @@ from django.core import management
 from django.contrib.auth.models import User
 from moderation.tests.apps.test_app1.models import UserProfile, \
     ModelWithSlugField2, ModelWithVisibilityField
-from moderation.managers import ModerationObjectsManager
+from moderation.managers import ModerationObjectsManager, \
+    ModerationQuerySet
 from django.db.models.manager import Manager
-from moderation.models import ModeratedObject
+from moderation.models import ModeratedObject, MODERATION_STATUS_APPROVED
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from moderation.moderator import GenericModerator
 from django.contrib.contenttypes import generic
 from django.db.models.query import EmptyQuerySet
 from moderation.tests.utils import setup_moderation, teardown_moderation
+from moderation.helpers import prefetch_moderated_objects, \
+    prefetch_moderated_related
 
 
 class ModerationObjectsManagerTestCase(SettingsTestCase):
@@ -73,6 +76,138 @@ class ModerationObjectsManagerTestCase(SettingsTestCase):
         self.assertEqual(unicode(UserProfile.objects.all()),
                          u'[<UserProfile: moderator - http://www.google.com>]')
 
+    def test_moderation_query_set_is_filtered_on_evaluation(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        query_set = UserProfile.objects.filter(pk=self.profile.pk)
+
+        self.assertTrue(isinstance(query_set, ModerationQuerySet))
+        self.assertEqual(unicode(query_set[:1]), u"[]")
+        self.assertEqual(query_set.count(), 0)
+        self.assertEqual(list(query_set.values_list('pk', flat=True)), [])
+        self.assertRaises(ObjectDoesNotExist, UserProfile.objects.get,
+                          pk=self.profile.pk)
+
+    def test_count_and_exists_match_iteration(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        moderator = self.moderation.get_moderator(UserProfile)
+
+        for description in [None, u'Changed without moderation']:
+            if description is not None:
+                UserProfile.unmoderated_objects.filter(pk=self.profile.pk)\
+                    .update(description=description)
+
+            for filter_in_database in [False, True]:
+                moderator.filter_in_database = filter_in_database
+                query_set = UserProfile.objects.all()
+                objects = list(UserProfile.objects.all())
+
+                self.assertEqual(query_set.count(), len(objects))
+                self.assertEqual(
+                    UserProfile.objects.filter(pk=self.profile.pk).exists(),
+                    bool(objects))
+
+    def create_profile(self, username):
+        # Raw save bypasses moderation, as loading of fixtures does
+        profile = UserProfile(description='Profile for new user',
+                              url='http://www.yahoo.com',
+                              user=User.objects.get(username=username))
+        profile.save_base(raw=True)
+        return profile
+
+    def test_get_excluded_pks_loads_objects_in_chunks(self):
+        from moderation.conf import settings
+
+        profiles = [self.profile] + [self.create_profile(username)
+                                     for username in ['user1', 'user2',
+                                                      'admin']]
+        for profile in profiles:
+            ModeratedObject(content_object=profile).save()
+
+        query_set = UserProfile.unmoderated_objects.all()
+
+        chunk_size = settings.FILTER_CHUNK_SIZE
+        try:
+            # Every chunk takes query of moderated objects and query of
+            # their objects, the last query finds no more moderated objects
+            for size, queries in [(1, 9), (2, 5), (3, 5), (4, 3)]:
+                settings.FILTER_CHUNK_SIZE = size
+
+                self.assertEqual(
+                    sorted(UserProfile.objects.get_excluded_pks(query_set)),
+                    sorted([profile.pk for profile in profiles]))
+                self.assertNumQueries(queries,
+                                      UserProfile.objects.get_excluded_pks,
+                                      query_set)
+        finally:
+            settings.FILTER_CHUNK_SIZE = chunk_size
+
+    def test_exclude_objs_by_moderated_objects(self):
+        """Test if objects with not visible moderated object are excluded
+        in database and approved objects are returned"""
+        ManagerClass = ModerationObjectsManager()(Manager)
+        manager = ManagerClass()
+        manager.model = UserProfile
+
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        query_set = UserProfile._default_manager.all()
+
+        self.assertEqual(
+            unicode(manager.exclude_objs_by_moderated_objects(query_set)),
+            u"[]")
+
+        moderated_object.moderation_status = MODERATION_STATUS_APPROVED
+        moderated_object.update_object_visibility(self.profile)
+        moderated_object.save()
+
+        self.assertEqual(
+            unicode(manager.exclude_objs_by_moderated_objects(query_set)),
+            u'[<UserProfile: moderator - http://www.google.com>]')
+
+    def test_prefetch_moderated_related(self):
+        user1 = User.objects.get(username='user1')
+        user2 = User.objects.get(username='user2')
+        profile1 = self.create_profile('user1')
+        profile2 = self.create_profile('user2')
+        ModeratedObject(content_object=profile1).save()
+
+        # Excluded objects, pks with their related instances and related
+        # objects are loaded once for all instances
+        self.assertNumQueries(5, prefetch_moderated_related,
+                              [self.user, user1, user2], 'user_profile_set')
+
+        related_objects = prefetch_moderated_related(
+            [self.user, user1, user2], 'user_profile_set')
+
+        self.assertEqual(related_objects, {self.user.pk: [self.profile],
+                                           user1.pk: [],
+                                           user2.pk: [profile2]})
+
+    def test_prefetch_moderated_objects(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        profiles = prefetch_moderated_objects(
+            UserProfile.unmoderated_objects.all())
+
+        self.assertNumQueries(0, lambda: profiles[0].moderated_object)
+        self.assertEqual(profiles[0].moderated_object, moderated_object)
+
+    def test_query_set_prefetch_moderated_objects(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.moderation_status = MODERATION_STATUS_APPROVED
+        moderated_object.save()
+
+        profiles = list(UserProfile.objects.all().prefetch_moderated_objects())
+
+        self.assertNumQueries(0, lambda: profiles[0].moderated_object)
+        self.assertEqual(profiles[0].moderated_object, moderated_object)
+
     def test_exclude_objs_by_visibility_col(self):
         ManagerClass = ModerationObjectsManager()(Manager)
         manager = ManagerClass()
@@ -7,6 +7,8 @@ from moderation.models import ModeratedObject, MODERATION_STATUS_APPROVED,\
     MODERATION_STATUS_PENDING, MODERATION_STATUS_REJECTED
 from django.core.exceptions import ObjectDoesNotExist
 from moderation.fields import SerializedObjectField
+from moderation.cache import deserialized_objects_cache
+from moderation.diff import get_fingerprint
 from moderation.register import ModerationManager, RegistrationError
 from moderation.moderator import GenericModerator
 from moderation.helpers import automoderate
@@ -51,6 +53,26 @@ class SerializationTestCase(SettingsTestCase):
             ' {"url": "http://www.test.com", "user": 2,'\
             ' "description": "Profile for new super user"}}]')
 
+    def test_serialize_with_inheritance_without_queries(self):
+        SuperUserProfile(description=u'Profile for new super user',
+                         url=u'http://www.test.com',
+                         user=User.objects.get(username='user1'),
+                         super_power=u'invisibility').save()
+        profile = SuperUserProfile.objects.get(super_power=u'invisibility')
+        json_field = SerializedObjectField()
+
+        self.assertNumQueries(0, json_field._serialize, profile)
+
+        value = json_field._serialize(profile)
+        deserialized_objects_cache.clear()
+
+        self.assertNumQueries(0, json_field._deserialize, value)
+
+        object = json_field._deserialize(value)
+
+        self.assertEqual(object.description, u'Profile for new super user')
+        self.assertEqual(object.super_power, u'invisibility')
+
     def test_deserialize(self):
         value = '[{"pk": 1, "model": "test_app1.userprofile", "fields": '\
                 '{"url": "http://www.google.com", "user": 1, '\
@@ -77,6 +99,168 @@ class SerializationTestCase(SettingsTestCase):
             repr(object),
             '<SuperUserProfile: user1 - http://www.test.com - invisibility>')
 
+    def test_serialize_with_codec(self):
+        profile = SuperUserProfile(description=u'Profile for new super user',
+                                   url=u'http://www.test.com',
+                                   user=User.objects.get(username='user1'),
+                                   super_power=u'invisibility')
+        profile.save()
+
+        field = SerializedObjectField(codec='tuple')
+        value = field._serialize(profile)
+
+        self.assertTrue(value.startswith('#!tuple:[1,'))
+        self.assertTrue(len(value) <
+                        len(SerializedObjectField()._serialize(profile)))
+
+        object = field._deserialize(value)
+
+        self.assertTrue(isinstance(object, SuperUserProfile))
+        self.assertEqual(
+            repr(object),
+            '<SuperUserProfile: user1 - http://www.test.com - '
+            'invisibility>')
+
+    def test_json_codec_output_is_same_as_django_serializer(self):
+        from django.core import serializers
+        from moderation.serialization import get_codec
+
+        self.user.groups.add(Group.objects.create(name='Editors'))
+        codec = get_codec('json')
+
+        for obj in [self.profile, self.user]:
+            value = codec.encode([obj])
+
+            self.assertEqual(value, serializers.serialize('json', [obj]))
+
+            object = codec.decode(value)[0]
+
+            self.assertEqual(object.__class__, obj.__class__)
+            self.assertEqual(object.pk, obj.pk)
+            self.assertEqual(repr(object), repr(obj))
+
+    def test_deserialize_without_header_with_codec(self):
+        value = '[{"pk": 1, "model": "test_app1.userprofile", "fields": '\
+                '{"url": "http://www.google.com", "user": 1, '\
+                '"description": "Profile description"}}]'
+        field = SerializedObjectField(codec='tuple')
+        object = field._deserialize(value)
+
+        self.assertEqual(repr(object),
+                         '<UserProfile: moderator - http://www.google.com>')
+
+    def test_serialize_with_compression(self):
+        self.profile.description = u'Long description ' * 100
+        field = SerializedObjectField(compress_threshold=1000)
+        value = field._serialize(self.profile)
+
+        self.assertTrue(value.startswith('#!z:'))
+        self.assertTrue(
+            len(value) < len(SerializedObjectField()._serialize(self.profile)))
+
+        object = field._deserialize(value)
+
+        self.assertEqual(object.description, u'Long description ' * 100)
+
+    def test_serialize_below_compress_threshold(self):
+        field = SerializedObjectField(compress_threshold=1000)
+
+        self.assertEqual(
+            field._serialize(self.profile),
+            '[{"pk": 1, "model": "test_app1.userprofile", "fields": '\
+            '{"url": "http://www.google.com", "user": 1, '\
+            '"description": "Old description"}}]',
+            )
+
+    def test_serialize_to_blob(self):
+        import shutil
+        import tempfile
+        from moderation.conf import settings
+
+        old_root = settings.BLOB_ROOT
+        settings.BLOB_ROOT = tempfile.mkdtemp()
+        try:
+            self.profile.description = u'Long description ' * 100
+            field = SerializedObjectField(blob_threshold=1000)
+            value = field._serialize(self.profile)
+
+            self.assertTrue(value.startswith('#!blob:'))
+            self.assertEqual(field._serialize(self.profile), value)
+
+            deserialized_objects_cache.clear()
+            object = field._deserialize(value)
+
+            self.assertEqual(object.description, u'Long description ' * 100)
+        finally:
+            shutil.rmtree(settings.BLOB_ROOT)
+            settings.BLOB_ROOT = old_root
+
+    def test_deserialize_of_missing_blob(self):
+        import shutil
+        import tempfile
+        from django.core.serializers.base import DeserializationError
+        from moderation.conf import settings
+
+        old_root = settings.BLOB_ROOT
+        settings.BLOB_ROOT = tempfile.mkdtemp()
+        try:
+            field = SerializedObjectField()
+
+            self.assertRaises(DeserializationError, field._deserialize,
+                              '#!blob:' + '0' * 40)
+        finally:
+            shutil.rmtree(settings.BLOB_ROOT)
+            settings.BLOB_ROOT = old_root
+
+    def test_serialize_delta(self):
+        field = SerializedObjectField(store_delta=True)
+        self.profile.description = u'New description'
+        value = field._serialize(self.profile)
+
+        self.assertTrue(value.startswith('#!delta:'))
+        self.assertTrue(u'New description' in value)
+        self.assertFalse(u'http://www.google.com' in value)
+
+        object = field._deserialize(value)
+
+        self.assertEqual(object.description, u'New description')
+        self.assertEqual(object.url, u'http://www.google.com')
+
+    def test_deserialize_delta_after_change_of_live_object(self):
+        field = SerializedObjectField(store_delta=True)
+        self.profile.description = u'New description'
+        value = field._serialize(self.profile)
+
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            url=u'http://www.example.com')
+
+        object = field._deserialize(value)
+
+        self.assertEqual(object.description, u'New description')
+        self.assertEqual(object.url, u'http://www.example.com')
+
+    def test_deserialize_delta_after_change_of_the_same_field(self):
+        from django.core.serializers.base import DeserializationError
+
+        field = SerializedObjectField(store_delta=True)
+        self.profile.description = u'New description'
+        value = field._serialize(self.profile)
+
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            description=u'Other description')
+
+        self.assertRaises(DeserializationError, field._deserialize, value)
+
+    def test_serialize_delta_of_unchanged_object(self):
+        field = SerializedObjectField(store_delta=True)
+
+        self.assertEqual(
+            field._serialize(self.profile),
+            '[{"pk": 1, "model": "test_app1.userprofile", "fields": '\
+            '{"url": "http://www.google.com", "user": 1, '\
+            '"description": "Old description"}}]',
+            )
+
     def test_deserialzed_object(self):
         moderated_object = ModeratedObject(content_object=self.profile)
         self.profile.description = 'New description'
@@ -92,6 +276,34 @@ class SerializationTestCase(SettingsTestCase):
         self.assertEqual(moderated_object.content_object.description,
                          u'Old description')
 
+    def test_changed_object_is_deserialized_on_first_access(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+        field = moderated_object._meta.get_field('changed_object')
+
+        self.assertFalse(field.is_deserialized(moderated_object))
+        self.assertTrue(field.has_serialized_value(moderated_object))
+        self.assertEqual(moderated_object.changed_object.description,
+                         u'Old description')
+        self.assertTrue(field.is_deserialized(moderated_object))
+
+    def test_save_of_not_deserialized_object(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+        moderated_object.moderation_reason = u'Reason'
+        moderated_object.save()
+
+        field = moderated_object._meta.get_field('changed_object')
+        self.assertFalse(field.is_deserialized(moderated_object))
+
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+        self.assertEqual(moderated_object.changed_object.description,
+                         u'Old description')
+
     def test_change_of_deserialzed_object(self):
         self.profile.description = 'New description'
         moderated_object = ModeratedObject(content_object=self.profile)
@@ -143,6 +355,53 @@ class ModerateTestCase(SettingsTestCase):
         self.assertEqual(self.profile.moderated_object.moderation_reason,
                          "Reason")
 
+    def test_change_after_approval_with_delta(self):
+        from moderation.conf import settings
+
+        old_store_delta = settings.STORE_DELTA
+        settings.STORE_DELTA = True
+        try:
+            self.profile.description = 'New description'
+            self.profile.save()
+            self.profile.moderated_object._moderate(
+                MODERATION_STATUS_APPROVED, self.user, "Reason")
+
+            profile = UserProfile.objects.get(pk=self.profile.pk)
+            profile.url = 'http://www.example.com'
+            profile.save()
+        finally:
+            settings.STORE_DELTA = old_store_delta
+
+        user_profile = UserProfile.unmoderated_objects.get(pk=self.profile.pk)
+
+        self.assertEqual(user_profile.description, 'New description')
+        self.assertEqual(user_profile.url, 'http://www.google.com')
+        self.assertEqual(UserProfile.objects.count(), 1)
+
+    def test_approve_with_delta_after_change_of_live_object(self):
+        from moderation.conf import settings
+
+        old_store_delta = settings.STORE_DELTA
+        settings.STORE_DELTA = True
+        try:
+            self.profile.description = 'New description'
+            self.profile.save()
+
+            UserProfile.unmoderated_objects.filter(pk=self.profile.pk)\
+                .update(url='http://www.example.com')
+
+            moderated_object = ModeratedObject.objects.get(
+                pk=self.profile.moderated_object.pk)
+            moderated_object._moderate(MODERATION_STATUS_APPROVED,
+                                       self.user, "Reason")
+        finally:
+            settings.STORE_DELTA = old_store_delta
+
+        user_profile = UserProfile.unmoderated_objects.get(pk=self.profile.pk)
+
+        self.assertEqual(user_profile.description, 'New description')
+        self.assertEqual(user_profile.url, 'http://www.example.com')
+
     def test_approve_moderated_object(self):
         """test if after object approval new data is saved."""
         self.profile.description = 'New description'
@@ -202,6 +461,55 @@ class ModerateTestCase(SettingsTestCase):
 
         self.assertEqual(value, False)
 
+    def test_changed_object_fingerprint(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+
+        self.assertEqual(moderated_object.changed_object_fingerprint,
+                         get_fingerprint(self.profile))
+
+    def test_has_object_been_changed_with_excluded_field(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+
+        self.profile.description = 'New description'
+
+        self.assertEqual(
+            moderated_object.has_object_been_changed(self.profile, []), True)
+        self.assertEqual(
+            moderated_object.has_object_been_changed(self.profile,
+                                                     ['description']),
+            False)
+
+    def test_has_object_been_changed_after_change_of_changed_object(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+
+        moderated_object.changed_object.description = 'New description'
+
+        self.assertEqual(
+            moderated_object.has_object_been_changed(self.profile, []), True)
+
+    def test_update_object_visibility(self):
+        moderated_object = ModeratedObject(content_object=self.profile)
+        moderated_object.save()
+        moderated_object = ModeratedObject.objects.get(pk=moderated_object.pk)
+
+        moderated_object.update_object_visibility(self.profile)
+        self.assertEqual(moderated_object.object_visible, False)
+
+        self.profile.description = 'New description'
+        moderated_object.update_object_visibility(self.profile)
+        self.assertEqual(moderated_object.object_visible, True)
+
+        moderated_object.moderation_status = MODERATION_STATUS_APPROVED
+        moderated_object.update_object_visibility()
+        self.assertEqual(moderated_object.object_visible, True)
+
 
 class AutoModerateTestCase(SettingsTestCase):
     fixtures = ['test_users.json', 'test_moderation.json']
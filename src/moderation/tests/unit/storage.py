@@ -0,0 +1,125 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+
+from moderation.storage import FileSystemBlobStorage, get_blob_storage
+
+
+class FileSystemBlobStorageTestCase(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.storage = FileSystemBlobStorage(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_save_and_load(self):
+        key = self.storage.save('changed object')
+
+        self.assertEqual(key, self.storage.get_key('changed object'))
+        self.assertTrue(self.storage.exists(key))
+        self.assertEqual(self.storage.load(key), 'changed object')
+
+    def test_load_of_empty_blob(self):
+        key = self.storage.save('')
+
+        self.assertEqual(self.storage.load(key), '')
+
+    def test_identical_data_is_stored_once(self):
+        key = self.storage.save('changed object')
+
+        self.assertEqual(self.storage.save('changed object'), key)
+        self.assertEqual(os.listdir(os.path.join(self.root, key[:2])),
+                         [key[2:]])
+
+    def test_delete(self):
+        key = self.storage.save('changed object')
+        self.storage.delete(key)
+
+        self.assertFalse(self.storage.exists(key))
+
+    def test_invalid_key(self):
+        self.assertRaises(ValueError, self.storage.load, '../settings.py')
+
+    def test_keys(self):
+        keys = [self.storage.save('changed object 1'),
+                self.storage.save('changed object 2')]
+        # Temporary file of blob that is being saved
+        open(os.path.join(self.root, keys[0][:2], 'tmpblob'), 'wb').close()
+
+        self.assertEqual(list(self.storage.keys()), sorted(keys))
+
+    def test_save_of_existing_blob_updates_modified_time(self):
+        key = self.storage.save('changed object')
+        modified_time = time.time() - 7200
+        os.utime(self.storage.path(key), (modified_time, modified_time))
+
+        self.storage.save('changed object')
+
+        self.assertTrue(self.storage.get_modified_time(key) > modified_time)
+
+    def test_blob_permissions(self):
+        from django.conf import settings
+
+        umask = os.umask(022)
+        try:
+            key = self.storage.save('changed object 1')
+        finally:
+            os.umask(umask)
+
+        self.assertEqual(os.stat(self.storage.path(key)).st_mode & 0777,
+                         0644)
+
+        old_permissions = settings.FILE_UPLOAD_PERMISSIONS
+        settings.FILE_UPLOAD_PERMISSIONS = 0640
+        try:
+            key = self.storage.save('changed object 2')
+        finally:
+            settings.FILE_UPLOAD_PERMISSIONS = old_permissions
+
+        self.assertEqual(os.stat(self.storage.path(key)).st_mode & 0777,
+                         0640)
+
+
+class GetBlobStorageTestCase(TestCase):
+
+    def setUp(self):
+        from moderation.conf import settings
+
+        self.old_root = settings.BLOB_ROOT
+        self.old_storage = settings.BLOB_STORAGE
+
+    def tearDown(self):
+        from moderation.conf import settings
+
+        settings.BLOB_ROOT = self.old_root
+        settings.BLOB_STORAGE = self.old_storage
+
+    def test_get_blob_storage(self):
+        from moderation.conf import settings
+
+        settings.BLOB_ROOT = '/tmp/blobs'
+        storage = get_blob_storage()
+
+        self.assertTrue(isinstance(storage, FileSystemBlobStorage))
+        self.assertEqual(storage.root, '/tmp/blobs')
+
+    def test_get_blob_storage_without_root(self):
+        from moderation.conf import settings
+
+        settings.BLOB_ROOT = None
+
+        self.assertRaises(ImproperlyConfigured, get_blob_storage)
+
+    def test_get_unknown_blob_storage(self):
+        from moderation.conf import settings
+
+        settings.BLOB_ROOT = '/tmp/blobs'
+        settings.BLOB_STORAGE = 'moderation.storage.UnknownStorage'
+
+        self.assertRaises(ImproperlyConfigured, get_blob_storage)